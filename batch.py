@@ -0,0 +1,205 @@
+import argparse
+import io
+import json
+import math
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cgt
+import endgame
+import minimax
+import proof_number as pn
+from bitboard import Bitboard
+from clobber import Player
+from transposition import PersistentTable, TranspositionTable
+
+# moves are named by column letter, see Minimax.move_to_coords
+MAX_WIDTH = 26
+# inputs that once stopped a whole batch, with the result --check expects for each
+CHECKS = [("/", "error"), ("." * 27 + "xo", "error"), ("xo/ox", "win")]
+
+# per worker process state, set up by init_worker
+_decomposer = None
+_endgame = None
+_store = None
+
+def init_worker(use_cgt, db_path, store_path):
+    global _decomposer, _endgame, _store
+    # component values are position independent, so each worker keeps them for the whole batch
+    if use_cgt:
+        _decomposer = cgt.Decomposer()
+    if db_path:
+        _endgame = endgame.EndgameTable(db_path)
+    # every worker opens the shared file itself, sqlite keeps their writes apart
+    if store_path:
+        _store = PersistentTable(store_path)
+
+def parse_positions(lines):
+    # yields every position as a '/' separated string of rows. a position is either one line with
+    # its rows separated by '/', or several lines of rows ended by a blank line. '#' starts a comment
+    rows = []
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if not line:
+            if rows:
+                yield "/".join(rows)
+                rows = []
+            continue
+        if "/" in line:
+            # a one line position ends any block of rows before it
+            if rows:
+                yield "/".join(rows)
+                rows = []
+            yield line
+            continue
+        rows.append(line)
+    if rows:
+        yield "/".join(rows)
+
+def check_position(position):
+    # None if position is a valid board, otherwise what is wrong with it
+    rows = position.split("/")
+    if re.search("[^xo.]", "".join(rows)):
+        return "unrecognized characters in position"
+    if len(set(len(row) for row in rows)) != 1:
+        return "rows have different lengths"
+    if not rows[0]:
+        return "empty rows"
+    if len(rows[0]) > MAX_WIDTH:
+        return f"more than {MAX_WIDTH} columns"
+    return None
+
+def to_board(position, player):
+    rows = position.split("/")
+    width, height = len(rows[0]), len(rows)
+    opponent = "x" if player == "o" else "o"
+    player_pieces = Player(player, width, height, True, position=rows).pieces
+    oppo_pieces = Player(opponent, width, height, False, position=rows).pieces
+    return Bitboard.from_pieces(width, height, player_pieces, oppo_pieces)
+
+def move_name(board, move):
+    return minimax.Minimax().move_to_coords(board.to_coords(move))
+
+def solve(position, player, engine, timeout, symmetry):
+    # solves position for player to move within timeout ms. the timeout is checked by the search
+    # itself, so a search overruns it by at most one check interval
+    start = time.perf_counter()
+    board = to_board(position, player)
+    if symmetry:
+        board.enable_symmetry()
+    result = {"position": position, "player": player, "outcome": "unknown", "move": None, "nodes": 0}
+    if not board.has_moves():
+        result["outcome"] = "loss"
+    elif engine == "dfpn":
+        search = pn.DFPNSearch(decomposer=_decomposer, endgame=_endgame)
+        phi, delta = search.search(board, timeout)
+        if phi == 0 or delta == 0:
+            result["outcome"] = "win" if phi == 0 else "loss"
+        # unsolved, this is the move towards the most promising child
+        result["move"] = move_name(board, search.get_best(board))
+        result["nodes"] = search.nodes
+    else:
+        search = minimax.AlphaBeta(_store if _store is not None else TranspositionTable(), decomposer=_decomposer, endgame=_endgame)
+        value, pv = search.iterative_deepening(board, math.inf, timeout)
+        search.table.flush()
+        if abs(value) == math.inf:
+            result["outcome"] = "win" if value > 0 else "loss"
+        if pv:
+            result["move"] = move_name(board, pv[0])
+        result["nodes"] = search.nodes
+    result["time"] = time.perf_counter() - start
+    return result
+
+def finished(path):
+    # (position, player) of every complete result line already in path, so an interrupted run can
+    # be resumed. a line cut off by the interruption is removed and its position solved again
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        f.truncate(data.rfind(b"\n") + 1)
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            done.add((result["position"], result["player"]))
+    return done
+
+def run(lines, out, player="o", engine="dfpn", timeout=math.inf, workers=None, use_cgt=False, db_path=None,
+        symmetry=False, skip=(), store_path=None):
+    # solves every position in lines on a process pool and writes one json line to out as each
+    # one finishes. returns the number of positions solved
+    jobs = []
+    for position in parse_positions(lines):
+        if (position, player) in skip:
+            continue
+        error = check_position(position)
+        if error is not None:
+            out.write(json.dumps({"position": position, "player": player, "error": error}) + "\n")
+            continue
+        jobs.append(position)
+    count = 0
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(use_cgt, db_path, store_path)) as pool:
+        futures = {pool.submit(solve, position, player, engine, timeout, symmetry): position for position in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                count += 1
+            except Exception as e:
+                # one position that breaks a search should not take the rest of the batch with it
+                result = {"position": futures[future], "player": player, "error": f"{type(e).__name__}: {e}"}
+            out.write(json.dumps(result) + "\n")
+            # flush every line, so results survive an interruption and --resume can skip them
+            out.flush()
+    return count
+
+def check(engine="dfpn", workers=None):
+    # runs CHECKS through run and returns a line for every position whose result is not the
+    # expected one
+    out = io.StringIO()
+    run([position + "\n" for position, _ in CHECKS], out, "o", engine, 1000, workers)
+    results = {}
+    for line in out.getvalue().splitlines():
+        result = json.loads(line)
+        results[result["position"]] = "error" if "error" in result else result["outcome"]
+    return [f"{position}: expected {expected}, got {results.get(position)}" for position, expected in CHECKS
+            if results.get(position) != expected]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="solve clobber positions on a process pool and stream the results as json lines")
+    parser.add_argument("input", nargs="?", help="file of positions in xo. rows, stdin if not given")
+    parser.add_argument("--out", help="append the results to this file instead of stdout")
+    parser.add_argument("--resume", action="store_true", help="skip positions that already have a result in --out")
+    parser.add_argument("--player", choices=["x", "o"], default="o", help="side to move in every position")
+    parser.add_argument("--engine", choices=["dfpn", "alphabeta"], default="dfpn", help="search used to solve positions")
+    parser.add_argument("--timeout", type=float, default=math.inf, help="milliseconds per position")
+    parser.add_argument("--workers", type=int, help="worker processes, one per cpu by default")
+    parser.add_argument("--cgt", action="store_true", help="solve positions that split into small components exactly")
+    parser.add_argument("--db", help="endgame database to look small positions up in")
+    parser.add_argument("--sym", action="store_true", help="treat mirror images of a position as one in the caches")
+    parser.add_argument("--store", help="sqlite file of searched positions that alphabeta reads and adds to, shared by all workers")
+    parser.add_argument("--check", action="store_true", help="run positions that once broke a batch and exit 1 if any result is wrong")
+    args = parser.parse_args()
+    if args.check:
+        failures = check(args.engine, args.workers)
+        for line in failures:
+            print(f"check failed: {line}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+    if args.resume and not args.out:
+        parser.error("--resume needs --out")
+    skip = finished(args.out) if args.resume else set()
+    lines = open(args.input) if args.input else sys.stdin
+    out = open(args.out, "a") if args.out else sys.stdout
+    try:
+        count = run(lines, out, args.player, args.engine, args.timeout, args.workers, args.cgt, args.db, args.sym, skip, args.store)
+    finally:
+        if args.input:
+            lines.close()
+        if args.out:
+            out.close()
+    print(f"solved {count} positions", file=sys.stderr)
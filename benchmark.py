@@ -0,0 +1,169 @@
+import argparse
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+import minimax
+import proof_number as pn
+from bitboard import Bitboard
+from clobber import Player
+
+# fixed corpus: standard starts, plus hand-picked midgames given as rows of x, o and '.'.
+# o is always the side to move.
+STARTS = [(3, 3), (4, 3), (4, 4), (5, 4), (6, 5), (6, 6)]
+MIDGAMES = {
+    "end-4x3": ["ox.o",
+                "x.xo",
+                ".oxx"],
+    "mid-5x4": ["xo.ox",
+                "oxxo.",
+                ".xoxo",
+                "xo.xx"],
+    "mid-5x5": ["xo.ox",
+                "o.xo.",
+                ".xoxo",
+                "xo..x",
+                "oxo.o"],
+    "mid-6x6": ["xoxo.o",
+                "o.oxox",
+                "xox.xo",
+                "oxoxo.",
+                "x.xoxo",
+                "oxo.ox"],
+}
+# minimax searches to the end of the game, so only run it on positions this small
+MINIMAX_PIECES = 10
+ALPHABETA_DEPTHS = (2, 4, 6)
+# proof number search stops after this many expansions if it has not solved the position
+PN_EXPANSIONS = 2000
+# timing differences this small are noise, whatever the ratio
+MIN_TIME_CHANGE = 0.005
+
+def corpus():
+    # (name, bitboard with o to move)
+    positions = []
+    for width, height in STARTS:
+        player = Player("o", width, height, True)
+        oppo = Player("x", width, height, False)
+        positions.append((f"start-{width}x{height}", Bitboard.from_pieces(width, height, player.pieces, oppo.pieces)))
+    for name, rows in MIDGAMES.items():
+        width, height = len(rows[0]), len(rows)
+        player = Player("o", width, height, True, position=rows)
+        oppo = Player("x", width, height, False, position=rows)
+        positions.append((name, Bitboard.from_pieces(width, height, player.pieces, oppo.pieces)))
+    return positions
+
+def engines(board):
+    # (engine name, run) for every engine that is benchmarked on board. run returns (nodes, move)
+    runs = []
+    if (board.player | board.oppo).bit_count() <= MINIMAX_PIECES:
+        runs.append(("minimax", lambda: run_minimax(board)))
+    for depth in ALPHABETA_DEPTHS:
+        runs.append((f"alphabeta-{depth}", lambda depth=depth: run_alphabeta(board, depth)))
+    runs.append(("pn", lambda: run_pn(board)))
+    return runs
+
+def move_name(board, move):
+    if move is None:
+        return None
+    return minimax.Minimax().move_to_coords(board.to_coords(move))
+
+def run_minimax(board):
+    engine = minimax.Minimax()
+    root = minimax.Node(-math.inf, "root", "max", None, board.copy(), [])
+    engine.search(root)
+    best = engine.get_best(root)
+    return engine.nodes, best.label if best is not root else None
+
+def run_alphabeta(board, depth):
+    engine = minimax.AlphaBeta()
+    value, pv = engine.iterative_deepening(board.copy(), depth)
+    return engine.nodes, move_name(board, pv[0] if pv else None)
+
+def run_pn(board):
+    engine = pn.PNSearch()
+    root = pn.Node("root", "or", None, board.copy(), [])
+    expansions = 0
+    path = [root]
+    while expansions < PN_EXPANSIONS and root.proof_number != 0 and root.disproof_number != 0:
+        path = engine.step(path)
+        expansions += 1
+    best = engine.get_best(root)
+    return len(engine.table) + 1, best.label if best is not root else None
+
+def measure(run, repeat):
+    # best wall time of repeat runs, then one more run under tracemalloc for the peak memory,
+    # which keeps the tracing overhead out of the timings
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        nodes, move = run()
+        best = min(best, time.perf_counter() - start)
+    # minimax trees hold reference cycles, so whatever earlier runs left for the collector would
+    # otherwise be freed, or not, during this one depending on what ran before
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"time": best, "nodes": nodes, "nps": nodes / best if best else None, "peak_memory": peak, "move": move}
+
+def run_suite(repeat=1, only=None, verbose=False):
+    results = []
+    for name, board in corpus():
+        for engine, run in engines(board):
+            if only and not any(pattern in f"{name} {engine}" for pattern in only):
+                continue
+            result = {"position": name, "engine": engine}
+            result.update(measure(run, repeat))
+            if verbose:
+                print(f"{name:12} {engine:12} {result['time']:8.3f}s {result['nodes']:9} nodes "
+                      f"{result['peak_memory'] / 1024:9.0f} KiB  {result['move']}", file=sys.stderr)
+            results.append(result)
+    return {"python": platform.python_version(), "repeat": repeat, "results": results}
+
+def compare(run, baseline, tolerance=0.1):
+    # lines describing every result that got slower by more than tolerance, searched more nodes,
+    # used more memory by more than tolerance or picked another move than in baseline
+    old = {(result["position"], result["engine"]): result for result in baseline["results"]}
+    regressions = []
+    for result in run["results"]:
+        key = (result["position"], result["engine"])
+        if key not in old:
+            continue
+        before = old[key]
+        name = f"{key[0]} {key[1]}"
+        if result["time"] > before["time"] * (1 + tolerance) and result["time"] - before["time"] > MIN_TIME_CHANGE:
+            regressions.append(f"{name}: time {before['time']:.3f}s -> {result['time']:.3f}s")
+        if result["nodes"] > before["nodes"]:
+            regressions.append(f"{name}: nodes {before['nodes']} -> {result['nodes']}")
+        if result["peak_memory"] > before["peak_memory"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {before['peak_memory']} -> {result['peak_memory']} bytes")
+        if result["move"] != before["move"]:
+            regressions.append(f"{name}: move {before['move']} -> {result['move']}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time every engine on a fixed set of clobber positions")
+    parser.add_argument("--out", help="write the results to this json file instead of stdout")
+    parser.add_argument("--baseline", help="json file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown before a result is flagged")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the fastest is kept")
+    parser.add_argument("--only", nargs="*", help="only run benchmarks whose 'position engine' name contains one of these")
+    args = parser.parse_args()
+    run = run_suite(args.repeat, args.only, verbose=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+    else:
+        print(json.dumps(run, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(run, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
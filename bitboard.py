@@ -0,0 +1,431 @@
+import random
+
+# masks are shared by every bitboard of the same size, so build them once
+_masks = {}
+
+def board_masks(width, height):
+    key = (width, height)
+    if key not in _masks:
+        full = (1 << (width * height)) - 1
+        first_col = 0
+        for y in range(height):
+            first_col |= 1 << (y * width)
+        last_col = first_col << (width - 1)
+        # (full, pieces allowed to move east, pieces allowed to move west)
+        _masks[key] = (full, full & ~last_col, full & ~first_col)
+    return _masks[key]
+
+# two random 64 bit keys per square: one for the side to move, one for its opponent. boards of
+# the same area but another shape get their own keys, so the same masks on a 4x3 and a 3x4 board
+# (different games) do not share a hash in a table that outlives one board
+_zobrist = {}
+
+def zobrist_keys(width, height):
+    key = (width, height)
+    if key not in _zobrist:
+        size = width * height
+        rng = random.Random(657 + 1000 * width + height)
+        _zobrist[key] = ([rng.getrandbits(64) for _ in range(size)], [rng.getrandbits(64) for _ in range(size)])
+    return _zobrist[key]
+
+_neighbours = {}
+
+def neighbour_masks(width, height):
+    # mask of the orthogonal neighbours of every square
+    key = (width, height)
+    if key not in _neighbours:
+        masks = []
+        for i in range(width * height):
+            x, y = i % width, i // width
+            mask = 0
+            for nx, ny in ((x + 1, y), (x, y + 1), (x - 1, y), (x, y - 1)):
+                if 0 <= nx < width and 0 <= ny < height:
+                    mask |= 1 << (ny * width + nx)
+            masks.append(mask)
+        _neighbours[key] = masks
+    return _neighbours[key]
+
+def bits(mask):
+    # yields the index of every set bit, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+_dihedral = {}
+
+def dihedral(width, height):
+    # the 8 rotations and reflections of a width x height rectangle as (width, height, perm) of the
+    # image, where perm[i] is the square that square i moves to. the identity comes first.
+    key = (width, height)
+    if key not in _dihedral:
+        images = []
+        for transpose in (False, True):
+            image_width, image_height = (height, width) if transpose else (width, height)
+            for flip_x in (False, True):
+                for flip_y in (False, True):
+                    perm = []
+                    for i in range(width * height):
+                        x, y = i % width, i // width
+                        if transpose:
+                            x, y = y, x
+                        if flip_x:
+                            x = image_width - 1 - x
+                        if flip_y:
+                            y = image_height - 1 - y
+                        perm.append(y * image_width + x)
+                    images.append((image_width, image_height, perm))
+        _dihedral[key] = images
+    return _dihedral[key]
+
+_transforms = {}
+
+def transforms(width, height):
+    # symmetries that map the board onto itself, without the identity: the reflections and the half
+    # turn, plus the quarter turns and diagonal reflections on square boards.
+    # returns (perms, inverses) as two parallel lists
+    key = (width, height)
+    if key not in _transforms:
+        perms = [perm for image_width, image_height, perm in dihedral(width, height)[1:]
+                 if (image_width, image_height) == (width, height)]
+        inverses = []
+        for perm in perms:
+            inverse = [0] * len(perm)
+            for i, j in enumerate(perm):
+                inverse[j] = i
+            inverses.append(inverse)
+        _transforms[key] = (perms, inverses)
+    return _transforms[key]
+
+def transform_mask(perm, mask):
+    result = 0
+    for i in bits(mask):
+        result |= 1 << perm[i]
+    return result
+
+def canonical_crop(width, height, player, oppo):
+    # smallest of the 8 rotations and reflections of a cropped position. pieces only interact with
+    # each other, never with the edge of the board, so every image has the same value
+    return min((image_width, image_height, transform_mask(perm, player), transform_mask(perm, oppo))
+               for image_width, image_height, perm in dihedral(width, height))
+
+def crop(width, player, oppo):
+    # moves the pieces to the top left corner and trims the board to their bounding box.
+    # returns (width, height, player, oppo) of the cropped position.
+    cells = [(i % width, i // width) for i in bits(player | oppo)]
+    if not cells:
+        return 0, 0, 0, 0
+    min_x = min(x for x, y in cells)
+    min_y = min(y for x, y in cells)
+    crop_width = max(x for x, y in cells) - min_x + 1
+    crop_height = max(y for x, y in cells) - min_y + 1
+    crop_player = 0
+    crop_oppo = 0
+    for x, y in cells:
+        bit = 1 << ((y - min_y) * crop_width + x - min_x)
+        if player >> (y * width + x) & 1:
+            crop_player |= bit
+        else:
+            crop_oppo |= bit
+    return crop_width, crop_height, crop_player, crop_oppo
+
+class Bitboard:
+    # one integer bitmask per side. bit (y * width + x) is set if the side has a piece at (x, y).
+    # player is always the side to move, so play() swaps the two masks.
+    __slots__ = ("width", "height", "player", "oppo", "hash", "swapped_hash", "symmetric_hashes")
+
+    def __init__(self, width, height, player=0, oppo=0, hashes=None, symmetric_hashes=None):
+        self.width = width
+        self.height = height
+        self.player = player
+        self.oppo = oppo
+        # zobrist hash of the position, plus the hash with the two sides swapped. keeping both
+        # lets play() update them incrementally even though the masks trade places every move.
+        if hashes is None:
+            hashes = self.zobrist()
+        self.hash, self.swapped_hash = hashes
+        # hashes of the position's symmetric images, one pair per transform, kept up to date the
+        # same way once enable_symmetry() has been called. None when symmetry is off
+        self.symmetric_hashes = symmetric_hashes
+
+    def zobrist(self, perm=None):
+        # hash pair of the position, or of its image under perm
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        key = 0
+        swapped = 0
+        for i in bits(self.player):
+            j = perm[i] if perm else i
+            key ^= player_keys[j]
+            swapped ^= oppo_keys[j]
+        for i in bits(self.oppo):
+            j = perm[i] if perm else i
+            key ^= oppo_keys[j]
+            swapped ^= player_keys[j]
+        return key, swapped
+
+    def enable_symmetry(self):
+        # makes canonical() and the caches keyed on it treat symmetric positions as one.
+        # every position played from this board inherits it
+        perms, inverses = transforms(self.width, self.height)
+        self.symmetric_hashes = [self.zobrist(perm) for perm in perms]
+        return self
+
+    def canonical(self):
+        # (key, transform): the smallest hash among the position and its symmetric images, and the
+        # index of the transform that gives it, None for the position itself.
+        # without symmetry enabled this is (hash, None)
+        key = self.hash
+        transform = None
+        if self.symmetric_hashes is not None:
+            for index, (image, swapped) in enumerate(self.symmetric_hashes):
+                if image < key:
+                    key = image
+                    transform = index
+        return key, transform
+
+    def to_canonical(self, move, transform):
+        # maps a move into the frame of the canonical image
+        if transform is None:
+            return move
+        perm = transforms(self.width, self.height)[0][transform]
+        return perm[move[0]], perm[move[1]]
+
+    def from_canonical(self, move, transform):
+        if transform is None:
+            return move
+        inverse = transforms(self.width, self.height)[1][transform]
+        return inverse[move[0]], inverse[move[1]]
+
+    def stabilizer(self):
+        # the symmetries that map the position onto itself
+        perms, inverses = transforms(self.width, self.height)
+        if self.symmetric_hashes is not None:
+            return [perm for perm, (image, swapped) in zip(perms, self.symmetric_hashes) if image == self.hash]
+        return [perm for perm in perms
+                if transform_mask(perm, self.player) == self.player and transform_mask(perm, self.oppo) == self.oppo]
+
+    def unique_moves(self, moves):
+        # drops every move that a symmetry of the position maps onto an earlier move: both lead to
+        # mirror images of the same position
+        stabilizer = self.stabilizer()
+        if not stabilizer:
+            return moves
+        seen = set()
+        unique = []
+        for origin, destination in moves:
+            if (origin, destination) in seen:
+                continue
+            unique.append((origin, destination))
+            for perm in stabilizer:
+                seen.add((perm[origin], perm[destination]))
+        return unique
+
+    def played_symmetric_hashes(self, origin, destination):
+        # symmetric_hashes after the player to move plays origin -> destination
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        hashes = []
+        for perm, (key, swapped) in zip(transforms(self.width, self.height)[0], self.symmetric_hashes):
+            o = perm[origin]
+            d = perm[destination]
+            hashes.append((swapped ^ player_keys[d] ^ oppo_keys[o] ^ oppo_keys[d],
+                           key ^ oppo_keys[d] ^ player_keys[o] ^ player_keys[d]))
+        return hashes
+
+    def undone_symmetric_hashes(self, origin, destination):
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        hashes = []
+        for perm, (key, swapped) in zip(transforms(self.width, self.height)[0], self.symmetric_hashes):
+            o = perm[origin]
+            d = perm[destination]
+            hashes.append((swapped ^ oppo_keys[d] ^ player_keys[o] ^ player_keys[d],
+                           key ^ player_keys[d] ^ oppo_keys[o] ^ oppo_keys[d]))
+        return hashes
+
+    @classmethod
+    def from_pieces(cls, width, height, player_pieces, oppo_pieces):
+        player = 0
+        oppo = 0
+        for x, y in player_pieces:
+            player |= 1 << (y * width + x)
+        for x, y in oppo_pieces:
+            oppo |= 1 << (y * width + x)
+        return cls(width, height, player, oppo)
+
+    def __eq__(self, other):
+        return (isinstance(other, Bitboard) and self.width == other.width and self.height == other.height
+                and self.player == other.player and self.oppo == other.oppo)
+
+    def __hash__(self):
+        return self.hash
+
+    def copy(self):
+        return Bitboard(self.width, self.height, self.player, self.oppo, (self.hash, self.swapped_hash), self.symmetric_hashes)
+
+    def pieces(self, mask):
+        return [(i % self.width, i // self.width) for i in bits(mask)]
+
+    @property
+    def player_pieces(self):
+        return self.pieces(self.player)
+
+    @property
+    def oppo_pieces(self):
+        return self.pieces(self.oppo)
+
+    def targets(self, player, oppo):
+        # squares captured by moving east, south, west and north respectively
+        full, movable_east, movable_west = board_masks(self.width, self.height)
+        east = ((player & movable_east) << 1) & oppo
+        south = (player << self.width) & oppo & full
+        west = ((player & movable_west) >> 1) & oppo
+        north = (player >> self.width) & oppo
+        return east, south, west, north
+
+    def spread(self, mask):
+        # mask plus every square orthogonally adjacent to it
+        full, movable_east, movable_west = board_masks(self.width, self.height)
+        return (mask | ((mask & movable_east) << 1) | ((mask & movable_west) >> 1)
+                | ((mask << self.width) & full) | (mask >> self.width))
+
+    def components(self):
+        # splits the pieces into groups that share no orthogonal adjacency
+        occupied = self.player | self.oppo
+        components = []
+        while occupied:
+            component = occupied & -occupied
+            while True:
+                grown = self.spread(component) & occupied
+                if grown == component:
+                    break
+                component = grown
+            occupied &= ~component
+            components.append(component)
+        return components
+
+    def moves(self, player=None, oppo=None):
+        # moves are (origin, destination) pairs of bit indices
+        if player is None:
+            player, oppo = self.player, self.oppo
+        east, south, west, north = self.targets(player, oppo)
+        moves = []
+        for offset, targets in ((1, east), (self.width, south), (-1, west), (-self.width, north)):
+            for destination in bits(targets):
+                moves.append((destination - offset, destination))
+        return moves
+
+    def count_moves(self, player=None, oppo=None):
+        if player is None:
+            player, oppo = self.player, self.oppo
+        east, south, west, north = self.targets(player, oppo)
+        return east.bit_count() + south.bit_count() + west.bit_count() + north.bit_count()
+
+    def mobility(self):
+        # (moves for the player to move, moves for the opponent)
+        return self.count_moves(self.player, self.oppo), self.count_moves(self.oppo, self.player)
+
+    def has_moves(self, player=None, oppo=None):
+        if player is None:
+            player, oppo = self.player, self.oppo
+        east, south, west, north = self.targets(player, oppo)
+        return bool(east | south | west | north)
+
+    def play(self, move):
+        # returns the position after move, with the opponent to move
+        origin, destination = move
+        player = (self.player & ~(1 << origin)) | (1 << destination)
+        oppo = self.oppo & ~(1 << destination)
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        key = self.swapped_hash ^ player_keys[destination] ^ oppo_keys[origin] ^ oppo_keys[destination]
+        swapped = self.hash ^ oppo_keys[destination] ^ player_keys[origin] ^ player_keys[destination]
+        symmetric_hashes = None
+        if self.symmetric_hashes is not None:
+            symmetric_hashes = self.played_symmetric_hashes(origin, destination)
+        return Bitboard(self.width, self.height, oppo, player, (key, swapped), symmetric_hashes)
+
+    def do(self, move):
+        # plays move in place. undo(move) restores the position exactly
+        origin, destination = move
+        if self.symmetric_hashes is not None:
+            self.symmetric_hashes = self.played_symmetric_hashes(origin, destination)
+        player = (self.player & ~(1 << origin)) | (1 << destination)
+        self.player = self.oppo & ~(1 << destination)
+        self.oppo = player
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        key = self.swapped_hash ^ player_keys[destination] ^ oppo_keys[origin] ^ oppo_keys[destination]
+        self.swapped_hash = self.hash ^ oppo_keys[destination] ^ player_keys[origin] ^ player_keys[destination]
+        self.hash = key
+
+    def undo(self, move):
+        origin, destination = move
+        oppo = self.player | (1 << destination)
+        if self.symmetric_hashes is not None:
+            self.symmetric_hashes = self.undone_symmetric_hashes(origin, destination)
+        self.player = (self.oppo & ~(1 << destination)) | (1 << origin)
+        self.oppo = oppo
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        key = self.swapped_hash ^ oppo_keys[destination] ^ player_keys[origin] ^ player_keys[destination]
+        self.swapped_hash = self.hash ^ player_keys[destination] ^ oppo_keys[origin] ^ oppo_keys[destination]
+        self.hash = key
+
+    def to_coords(self, move):
+        origin, destination = move
+        return ((origin % self.width, origin // self.width), (destination % self.width, destination // self.width))
+
+    def from_coords(self, move):
+        (x0, y0), (x1, y1) = move
+        return (y0 * self.width + x0, y1 * self.width + x1)
+
+    def position(self, player, opponent):
+        result = ["  "]
+        alphabet = list("abcdefghijklmnopqrstuvwxyz")
+        result.append(" ".join(alphabet[:self.width]))
+        result.append('\n')
+        for y in range(self.height):
+            result.append(f"{y + 1} ")
+            for x in range(self.width):
+                bit = 1 << (y * self.width + x)
+                if self.player & bit:
+                    result.append(player)
+                elif self.oppo & bit:
+                    result.append(opponent)
+                else:
+                    result.append('.')
+                result.append(' ')
+            result.append('\n')
+        return ''.join(result)
+
+class MobilityBitboard(Bitboard):
+    # bitboard that keeps its mobility up to date through do/undo, so reading it is O(1).
+    # every pair of orthogonally adjacent opposing pieces is exactly one capture for each side,
+    # so a single count of those contacts is the mobility of both players.
+    __slots__ = ("contacts",)
+
+    def __init__(self, width, height, player=0, oppo=0, hashes=None, symmetric_hashes=None):
+        super().__init__(width, height, player, oppo, hashes, symmetric_hashes)
+        self.contacts = self.count_moves()
+
+    @classmethod
+    def from_board(cls, board):
+        return cls(board.width, board.height, board.player, board.oppo, (board.hash, board.swapped_hash), board.symmetric_hashes)
+
+    def copy(self):
+        return MobilityBitboard.from_board(self)
+
+    def contact_change(self, move):
+        # change in contacts when the player to move plays move. only the squares around the origin
+        # and the destination change: the origin empties and the destination changes side.
+        origin, destination = move
+        neighbours = neighbour_masks(self.width, self.height)
+        return (1 - (self.oppo & neighbours[origin]).bit_count() - (self.player & neighbours[destination]).bit_count()
+                + (self.oppo & neighbours[destination]).bit_count())
+
+    def do(self, move):
+        self.contacts += self.contact_change(move)
+        super().do(move)
+
+    def undo(self, move):
+        super().undo(move)
+        self.contacts -= self.contact_change(move)
+
+    def mobility(self):
+        return self.contacts, self.contacts
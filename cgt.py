@@ -0,0 +1,181 @@
+from bitboard import Bitboard, canonical_crop, crop
+
+# short combinatorial games in canonical form. every canonical game is interned, so two games
+# are equal exactly when they are the same object, and the caches below can key on id().
+_interned = {}
+_le_cache = {}
+_sum_cache = {}
+_neg_cache = {}
+
+class Game:
+    __slots__ = ("left", "right", "interned")
+
+    def __init__(self, left, right, interned=False):
+        # tuples of left and right options
+        self.left = left
+        self.right = right
+        self.interned = interned
+
+    def __repr__(self):
+        if self is ZERO:
+            return "0"
+        left = ",".join(repr(g) for g in self.left)
+        right = ",".join(repr(g) for g in self.right)
+        return "{" + left + "|" + right + "}"
+
+def intern(left, right):
+    key = (frozenset(id(g) for g in left), frozenset(id(g) for g in right))
+    if key not in _interned:
+        _interned[key] = Game(tuple(left), tuple(right), True)
+    return _interned[key]
+
+ZERO = intern((), ())
+
+def le(g, h):
+    # g <= h unless some left option of g is >= h or some right option of h is <= g
+    cacheable = g.interned and h.interned
+    if cacheable:
+        key = (id(g), id(h))
+        if key in _le_cache:
+            return _le_cache[key]
+    result = (not any(le(h, gl) for gl in g.left)) and (not any(le(hr, g) for hr in h.right))
+    if cacheable:
+        _le_cache[key] = result
+    return result
+
+def unique(games):
+    seen = {}
+    for g in games:
+        seen[id(g)] = g
+    return list(seen.values())
+
+def canonical(left, right):
+    # removes dominated options and bypasses reversible ones until neither applies
+    left = unique(left)
+    right = unique(right)
+    while True:
+        left = [gl for gl in left if not any(other is not gl and le(gl, other) for other in left)]
+        right = [gr for gr in right if not any(other is not gr and le(other, gr) for other in right)]
+        g = Game(tuple(left), tuple(right))
+        changed = False
+        new_left = []
+        for gl in left:
+            reversing = next((glr for glr in gl.right if le(glr, g)), None)
+            if reversing is None:
+                new_left.append(gl)
+            else:
+                new_left.extend(reversing.left)
+                changed = True
+        new_right = []
+        for gr in right:
+            reversing = next((grl for grl in gr.left if le(g, grl)), None)
+            if reversing is None:
+                new_right.append(gr)
+            else:
+                new_right.extend(reversing.right)
+                changed = True
+        if not changed:
+            return intern(left, right)
+        left = unique(new_left)
+        right = unique(new_right)
+
+def neg(g):
+    key = id(g)
+    if key not in _neg_cache:
+        _neg_cache[key] = intern([neg(gr) for gr in g.right], [neg(gl) for gl in g.left])
+    return _neg_cache[key]
+
+def add(g, h):
+    if g is ZERO:
+        return h
+    if h is ZERO:
+        return g
+    key = (id(g), id(h)) if id(g) < id(h) else (id(h), id(g))
+    if key not in _sum_cache:
+        left = [add(gl, h) for gl in g.left] + [add(g, hl) for hl in h.left]
+        right = [add(gr, h) for gr in g.right] + [add(g, hr) for hr in h.right]
+        _sum_cache[key] = canonical(left, right)
+    return _sum_cache[key]
+
+def left_wins_first(g):
+    # left moving first wins iff some left option is >= 0
+    return any(le(ZERO, gl) for gl in g.left)
+
+def sum_left_wins_first(games):
+    # outcome of g1 + ... + gn with left to move, without building the full sum:
+    # left wins moving first iff not (g1 + ... + gn <= 0), i.e. not (g1 + ... + gn-1 <= -gn)
+    if not games:
+        return False
+    total = ZERO
+    for g in games[:-1]:
+        total = add(total, g)
+    return not le(total, neg(games[-1]))
+
+class Decomposer:
+    # splits clobber positions into components that share no orthogonal adjacency and solves the
+    # sum through the components' canonical values. left is the player to move in the position.
+    def __init__(self, max_cells=10, max_single=4):
+        # components with more pieces than max_cells, or positions that are a single component
+        # with more than max_single pieces, are left to the search
+        self.max_cells = max_cells
+        self.max_single = max_single
+        # (width, height, left, right) of a component cropped to its bounding box -> canonical value.
+        # cropping lets equal shapes anywhere on the board share one entry, and canonical_crop lets
+        # rotated and reflected shapes share it too
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def components(self, board):
+        # a component with a single colour has no moves for either side, so its value is 0
+        return [c for c in board.components() if board.player & c and board.oppo & c]
+
+    def component_values(self, board, components):
+        # canonical value of every component of board, or None if one of them is too big
+        values = []
+        for component in components:
+            left = board.player & component
+            right = board.oppo & component
+            if component.bit_count() > self.max_cells:
+                return None
+            values.append(self.component_value(*canonical_crop(*crop(board.width, left, right))))
+        return values
+
+    def component_value(self, width, height, left, right):
+        key = (width, height, left, right)
+        if key in self.values:
+            self.hits += 1
+            return self.values[key]
+        self.misses += 1
+        # the hash is never used, so skip computing it
+        board = Bitboard(width, height, left, right, (0, 0))
+        left_options = []
+        for origin, destination in board.moves(left, right):
+            after = Bitboard(width, height, (left & ~(1 << origin)) | (1 << destination), right & ~(1 << destination), (0, 0))
+            left_options.append(self.value(after))
+        right_options = []
+        for origin, destination in board.moves(right, left):
+            after = Bitboard(width, height, left & ~(1 << destination), (right & ~(1 << origin)) | (1 << destination), (0, 0))
+            right_options.append(self.value(after))
+        value = canonical(left_options, right_options)
+        self.values[key] = value
+        return value
+
+    def value(self, board):
+        # canonical value of the whole position, the sum of its components
+        total = ZERO
+        for value in self.component_values(board, self.components(board)):
+            total = add(total, value)
+        return total
+
+    def outcome(self, board):
+        # True if the player to move wins, False if they lose, None if a component is too big.
+        # a lone component is left to the search too: solving it through its value needs every
+        # position below it, where the search can stop at the first winning move.
+        components = self.components(board)
+        if len(components) == 1 and components[0].bit_count() > self.max_single:
+            return None
+        values = self.component_values(board, components)
+        if values is None:
+            return None
+        return sum_left_wins_first(values)
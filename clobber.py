@@ -1,11 +1,20 @@
 import proof_number as pn
 import minimax
+from bitboard import Bitboard, bits, neighbour_masks, zobrist_keys
 import string
 from PrettyPrint import PrettyPrintTree
 import math
 import time
 import re
 import handlers
+import parallel
+import mcts
+from transposition import PersistentTable, TranspositionTable
+from ponder import Ponderer
+import cgt
+import endgame
+import os
+import json
 import textwrap
 
 class Player:
@@ -29,11 +38,29 @@ class Player:
         return pieces
 
 class Board:
+    # the game as played in the cli. grid holds the id of the piece on every square, None if it
+    # is empty, at index y * width + x. the players' piece lists are only read to set it up
     def __init__(self, width, height, players):
         self.width = width
         self.height = height
         self.player_1 = players[0]
         self.player_2 = players[1]
+        self.grid = [None] * (width * height)
+        # per side: bitmask of its pieces, and the xor of the zobrist keys of its pieces as the side
+        # to move and as the opponent, so snapshot() builds a hashed Bitboard in O(1)
+        self.masks = {}
+        self.keys = {}
+        # per side: legal moves as (origin, destination) square indices, the same as Bitboard moves
+        self.legal = {}
+        for player in players:
+            self.masks[player.id] = 0
+            self.keys[player.id] = (0, 0)
+            self.legal[player.id] = set()
+            for x, y in player.pieces:
+                self.place(y * width + x, player.id)
+        for square in range(width * height):
+            self.add_moves(square)
+        # every move played: (origin, destination, id of the side that moved, id of the captured side)
         self.moves = []
 
     def __str__(self):
@@ -44,25 +71,76 @@ class Board:
         for y in range(self.height):
             result.append(f"{y + 1} ")
             for x in range(self.width):
-                if (x, y) in self.player_1.pieces:
-                    result.append(f'{self.player_1.id}')
-                elif (x, y) in self.player_2.pieces:
-                    result.append(f'{self.player_2.id}')
-                else:
-                    result.append('.')
+                piece = self.grid[y * self.width + x]
+                result.append(piece if piece is not None else '.')
                 result.append(' ')
             result.append('\n')
         return ''.join(result)
-    
+
+    def opponent(self, player):
+        return self.player_2.id if player == self.player_1.id else self.player_1.id
+
+    def place(self, square, player):
+        # puts a piece of player on square, or takes the piece there off if player is None
+        old = self.grid[square]
+        player_keys, oppo_keys = zobrist_keys(self.width, self.height)
+        for side in (old, player):
+            if side is not None:
+                self.masks[side] ^= 1 << square
+                key, swapped = self.keys[side]
+                self.keys[side] = (key ^ player_keys[square], swapped ^ oppo_keys[square])
+        self.grid[square] = player
+
+    def remove_moves(self, square):
+        # drops every legal move from or onto square
+        for neighbour in bits(neighbour_masks(self.width, self.height)[square]):
+            for legal in self.legal.values():
+                legal.discard((square, neighbour))
+                legal.discard((neighbour, square))
+
+    def add_moves(self, square):
+        # adds every legal move from or onto square
+        piece = self.grid[square]
+        if piece is None:
+            return
+        for neighbour in bits(neighbour_masks(self.width, self.height)[square]):
+            other = self.grid[neighbour]
+            if other is not None and other != piece:
+                self.legal[piece].add((square, neighbour))
+                self.legal[other].add((neighbour, square))
+
+    def update(self, origin, destination, mover, captured):
+        # moves mover's piece from origin to destination, leaving a piece of captured at origin if
+        # captured is not None. only moves around the two squares change
+        self.remove_moves(origin)
+        self.remove_moves(destination)
+        self.place(origin, captured)
+        self.place(destination, mover)
+        self.add_moves(origin)
+        self.add_moves(destination)
+
+    def snapshot(self, player):
+        # Bitboard of the position with player to move. it shares nothing with the board
+        oppo = self.opponent(player)
+        player_key, player_swapped = self.keys[player]
+        oppo_key, oppo_swapped = self.keys[oppo]
+        return Bitboard(self.width, self.height, self.masks[player], self.masks[oppo],
+                        (player_key ^ oppo_swapped, player_swapped ^ oppo_key))
+
+    def has_moves(self, player):
+        return bool(self.legal[player])
+
     def check_validity(self, game_player, oppo, coord, destination):
-        if coord not in game_player.pieces:
-            return (False, "Cannot move requested piece")
         if destination[0] < 0 or destination[1] < 0:
             return (False, "Cannot move off of board")
         if destination[0] >= self.width or destination[1] >= self.height:
             return (False, "Cannot move off of board")
+        if not (0 <= coord[0] < self.width and 0 <= coord[1] < self.height):
+            return (False, "Cannot move requested piece")
+        if self.grid[coord[1] * self.width + coord[0]] != game_player.id:
+            return (False, "Cannot move requested piece")
         # if destination is not opponent color, return 
-        if destination not in oppo.pieces:
+        if (coord[1] * self.width + coord[0], destination[1] * self.width + destination[0]) not in self.legal[game_player.id]:
             return (False, "Cannot move to requested square")
         return (True, "No error")
     
@@ -75,14 +153,13 @@ class Board:
             game_player = self.player_2
             oppo = self.player_1
         if not game_player:
-            return(f"{player} is not a piece.")
+            return (False, f"{player} is not a piece.")
         valid, error = self.check_validity(game_player, oppo, coord, destination)
         if valid:
-            # remove piece from coord and add piece of opposite color to destination
-            game_player.pieces.remove(coord)
-            game_player.pieces.append(destination)
-            oppo.pieces.remove(destination)
-            self.moves.append((coord, destination))
+            origin = coord[1] * self.width + coord[0]
+            target = destination[1] * self.width + destination[0]
+            self.update(origin, target, player, None)
+            self.moves.append((origin, target, player, oppo.id))
             return (valid, error)
         else:
             return (valid, error)
@@ -90,32 +167,16 @@ class Board:
     def undo(self):
         if not self.moves:
             return (False, "No moves to undo.")
-        coord, destination = self.moves.pop()
-        if destination in self.player_1.pieces:
-            self.player_1.pieces.remove(destination)
-            self.player_2.pieces.append(destination)
-            self.player_1.pieces.append(coord)
-            return (True, "")
-        elif destination in self.player_2.pieces:
-            self.player_2.pieces.remove(destination)
-            self.player_1.pieces.append(destination)
-            self.player_2.pieces.append(coord)
-            return (True, "")
-        else:
-            return (False, "Cannot identify last move.")
-        
-    def move_destination(self, origin, destination):
-        valid, error = self.check_validity(origin, destination)
-        if valid:
-            # remove piece from coord and add piece of opposite color to destination
-            self.player.pieces.remove(origin)
-            self.player.pieces.append(destination)
-            self.opponent.pieces.remove(destination)
-            
-            self.player, self.opponent = self.opponent, self.player
-            return error
-        else:
-            return error
+        origin, destination, mover, captured = self.moves.pop()
+        self.update(destination, origin, mover, captured)
+        return (True, "")
+
+def ponder_position(board, player):
+    # bitboard the engine playing player thinks about while waiting: its own move if the opponent
+    # moved last, otherwise the opponent's, whose search covers every reply the engine may face
+    if board.moves and board.moves[-1][2] == player:
+        return board.snapshot(board.opponent(player))
+    return board.snapshot(player)
 
 def get_destination_coord(origin, dir):
     directions = {
@@ -135,6 +196,21 @@ def pt(engine, to_print):
     print_tree(to_print)
     return
 
+def load_endgame(path="endgame.db"):
+    if not os.path.exists(path):
+        return None
+    return endgame.EndgameTable(path)
+
+def show_stats(stats, user, path="stats.log"):
+    # 'stats' prints what the search did, 'log' appends it to path as one json line
+    if stats is None:
+        return
+    if "stats" in user:
+        print(stats.report())
+    if "log" in user:
+        with open(path, "a") as f:
+            f.write(json.dumps(stats.as_dict()) + "\n")
+
 def game_loop():
     verbose = False
     #verbose = input("Pretty print search tree? (y / n)")
@@ -151,7 +227,21 @@ def game_loop():
             "a3 s' will move the piece x at position a3 down to capture the piece below it",
         "show": "print the current position",
         "undo": "undoes the previous move",
-        "ai {engine} {piece}": "plays a move using the specified engine (minimax or alphabeta) using the specified pieces. a-b only searches dpth 4 with a bad heuristic",
+        "ai {engine} {piece}": "plays a move using the specified engine (minimax or alphabeta) using the specified pieces. a-b deepens to depth "
+            "4 with a bad heuristic, or use 'ai alphabeta {piece} {depth} {time}' to stop after depth or time milliseconds. "
+            "add 'tt' to use a transposition table, 'cgt' to solve positions that split into small independent regions exactly, and 'db' "
+            "to look up small positions in endgame.db (built by 'python3 endgame.py'). 'sym' makes the tt treat mirror images of a "
+            "position as one, 'static' breaks move ordering ties by how few replies a move leaves, 'stats' prints what the search did and 'log' appends it to stats.log as json. 'ai parallel {piece} {depth} {time} {workers}' "
+            "runs alphabeta on several processes (one per cpu by default). 'ai pvs' takes the same arguments as alphabeta and runs "
+            "principal variation search, which tests most moves with a null window. 'ai solve {piece} {time}' searches until it knows who wins "
+            "and plays a winning move if there is one. 'ai mcts {piece} {playouts} {time} {workers}' runs monte carlo tree search "
+            "with random playouts (2000 by default), on several processes if workers is given. add 'biased' to prefer captures "
+            "that leave the capturing piece more to capture in the playouts. 'store' makes alphabeta, pvs and solve share a "
+            "transposition table saved in positions.db with later sessions and other processes",
+        "pn {piece} {time}": "plays a move using proof number search, for at most time milliseconds if given. add 'dfpn' to use "
+            "depth-first proof number search, which keeps memory bounded. 'cgt', 'db' and 'sym' work as for ai",
+        "ponder {piece}": "searches in the background while waiting for input, for the engine playing piece. 'ai alphabeta', "
+            "'ai pvs' and 'ai solve' reuse what it found. add 'store' to keep it in positions.db, 'ponder off' stops",
         "explain {engine} {piece}": "plays a move using specified engine to depth 3 (with randomized heuristic), then prints game tree step-by-step",
         "help": "prints this message",
     }
@@ -168,9 +258,23 @@ def game_loop():
     player_1 = None
     player_2 = None
     board = None
+    # component values are position independent, so keep them for the whole session
+    decomposer = cgt.Decomposer()
+    # memory-mapped on first use of 'db'
+    endgame_table = None
+    # opened on first use of 'store', and kept so every search of the session shares it
+    position_store = None
+    # side the engine plays while pondering, None when pondering is off
+    ponder_side = None
+    ponderer = None
     actions = [c.split()[0].rstrip(":") for c in help_text.keys()]
     while True:
+        if ponder_side is not None and board is not None:
+            ponderer.start(ponder_position(board, ponder_side))
         user = input().split(" ")
+        if ponderer is not None:
+            # the table is only ever used by one search at a time
+            ponderer.stop()
         action = user[0]
         if action == "help":
             for command, text in help_text.items():
@@ -178,10 +282,25 @@ def game_loop():
         if action not in actions:
             print("Lo siento, no comprendo.")
             continue
+        if "db" in user[1:] and endgame_table is None:
+            endgame_table = load_endgame()
+            if endgame_table is None:
+                print("No endgame database found, build one with 'python3 endgame.py'.")
+        db = endgame_table if "db" in user[1:] else None
+        if "store" in user[1:] and position_store is None:
+            position_store = PersistentTable("positions.db")
+        store = position_store if "store" in user[1:] else None
+        if store is None and ponder_side is not None:
+            store = ponderer.table
         if action == "quit":
+            if position_store is not None:
+                position_store.close()
             print("Goodbye :)")
             return
         if action == "size":
+            if ponderer is not None and ponderer.table is not position_store:
+                # start the new game with an empty table rather than the last game's positions
+                ponderer = Ponderer(TranspositionTable())
             try:
                 args = user[1].split("x")
                 width = int(args[0])
@@ -207,6 +326,16 @@ def game_loop():
             except:
                 print("Unknown argument.")
                 continue
+        if action == "ponder":
+            if len(user) < 2 or user[1] not in ["x", "o", "off"]:
+                print("Please provide a player [x, o] or off.")
+                continue
+            if user[1] == "off":
+                ponder_side = None
+                continue
+            ponder_side = user[1]
+            ponderer = Ponderer(store if store is not None else TranspositionTable())
+            continue
         if action == "show":
             if board == None:
                 print("Please provide board size.")
@@ -234,6 +363,9 @@ def game_loop():
                 print("Unknown argument.")
                 continue
         if action == "pn":
+            if board == None:
+                print("Please provide board size.")
+                continue
             if len(user) <= 1:
                 print("Please provide a player.")
                 continue
@@ -244,28 +376,34 @@ def game_loop():
                 search_time = int(user[2])
             except:
                 search_time = math.inf
-            if user[1] == "o":
-                player_pieces = board.player_1.pieces
-                oppo_pieces = board.player_2.pieces
+            if not board.has_moves(user[1]):
+                print("No moves available.")
+                continue
+            root_board = board.snapshot(user[1])
+            if "sym" in user:
+                root_board.enable_symmetry()
+            if "dfpn" in user:
+                dfpn = pn.DFPNSearch(decomposer=decomposer if "cgt" in user else None, endgame=db)
+                dfpn.search(root_board, search_time)
+                piece, destination = root_board.to_coords(dfpn.get_best(root_board))
             else:
-                player_pieces = board.player_2.pieces
-                oppo_pieces = board.player_1.pieces
-            root = pn.Node("root", "or", None, player_pieces, oppo_pieces, [])
-            if verbose:
-                pt("pn", root)
-                print("-" * 100)
-            pns = pn.PNSearch()
-            start = time.time() * 1000
-            while time.time() * 1000 < start + search_time:
-                to_expand = pns.select(root)
-                pns.expand(to_expand)
+                root = pn.Node("root", "or", None, root_board, [])
                 if verbose:
                     pt("pn", root)
                     print("-" * 100)
-                if root.proof_number == 0 or root.disproof_number == 0:
-                    break
-            best_node = pns.get_best(root)
-            piece, destination = best_node.parent_move
+                pns = pn.PNSearch(decomposer if "cgt" in user else None, db)
+                start = time.time() * 1000
+                # each step selects from where the last one left off instead of from the root
+                path = [root]
+                while time.time() * 1000 < start + search_time:
+                    path = pns.step(path)
+                    if verbose:
+                        pt("pn", root)
+                        print("-" * 100)
+                    if root.proof_number == 0 or root.disproof_number == 0:
+                        break
+                best_node = pns.get_best(root)
+                piece, destination = best_node.parent_move
             success, result = board.move(user[1], piece, destination)
             if not success:
                 print(result)
@@ -275,7 +413,13 @@ def game_loop():
                 print("Please provide board size.")
                 continue
             if len(user) < 3:
-                print("Please include a game engine [minimax, alphabeta], and a player [x, o].")
+                print("Please include a game engine [minimax, alphabeta, pvs, parallel, solve, mcts], and a player [x, o].")
+                continue
+            if user[2] not in ["x", "o"]:
+                print("Unknown player.")
+                continue
+            if not board.has_moves(user[2]):
+                print("No moves available.")
                 continue
             try:
                 search_time = int(user[4])
@@ -283,21 +427,59 @@ def game_loop():
                 search_time = math.inf
 
             handler = None
+            want_stats = "stats" in user or "log" in user
 
+            if user[1] == "solve":
+                try:
+                    search_time = int(user[3])
+                except:
+                    search_time = math.inf
+                handler = handlers.SolveHandler(minimax.Solver(decomposer if "cgt" in user else None, db, store), user[2], board, search_time, symmetry="sym" in user, stats=want_stats)
+            if user[1] == "mcts":
+                try:
+                    playouts = int(user[3])
+                except:
+                    # with a time limit, keep playing out until the time runs out
+                    playouts = 2000 if search_time == math.inf else math.inf
+                try:
+                    workers = int(user[5])
+                except:
+                    workers = 1
+                handler = handlers.MCTSHandler(mcts.MCTS(workers, biased="biased" in user), user[2], board, search_time, playouts, stats=want_stats)
             if user[1] == "minimax":
-                handler = handlers.MinimaxHandler(minimax.Minimax(), user[2], board, search_time)            
-            if user[1] == "alphabeta":
-                handler = handlers.AlphaBetaHandler(minimax.AlphaBeta(), int(user[3]), 4, board, search_time)
+                handler = handlers.MinimaxHandler(minimax.Minimax(decomposer if "cgt" in user else None, db), user[2], board, search_time, stats=want_stats)            
+            if user[1] in ["alphabeta", "pvs", "parallel"]:
+                try:
+                    depth = int(user[3])
+                except:
+                    # with a time limit, keep deepening until the time runs out
+                    depth = 4 if search_time == math.inf else math.inf
+                if user[1] == "parallel":
+                    try:
+                        workers = int(user[5])
+                    except:
+                        workers = None
+                    handler = handlers.AlphaBetaHandler(parallel.ParallelAlphaBeta(workers, table="tt" in user), depth, user[2], board, search_time, symmetry="sym" in user, stats=want_stats)
+                else:
+                    engine = minimax.PVS if user[1] == "pvs" else minimax.AlphaBeta
+                    handler = handlers.AlphaBetaHandler(engine(store, decomposer if "cgt" in user else None, db, static_ordering="static" in user), depth, user[2], board, search_time, table="tt" in user, symmetry="sym" in user, stats=want_stats)
             
             if not handler:
                 print("Please choose a specified engine.")
                 continue
             
-            success, result = handler.run()
+            success, result, stats = handler.run()
 
             if not success:
                 print(result)
             print(board.__str__())
+            if user[1] == "mcts" and handler.win_rate is not None:
+                print(f"estimated win rate for {user[2]}: {handler.win_rate:.1%}")
+            if user[1] == "solve" and handler.outcome is not None:
+                print(f"{user[2]} {'wins' if handler.outcome else 'loses'} with best play")
+            if user[1] in ["alphabeta", "pvs"] and handler.hit_rate() is not None and stats is None:
+                print(f"transposition table hit rate: {handler.hit_rate():.1%}")
+            show_stats(stats, user)
 
         if action == "explain":
             if board == None:
@@ -306,6 +488,12 @@ def game_loop():
             if len(user) < 3:
                 print("Please include a game engine [alphabeta] and a player [x, o].")
                 continue
+            if user[2] not in ["x", "o"]:
+                print("Unknown player.")
+                continue
+            if not board.has_moves(user[2]):
+                print("No moves available.")
+                continue
             try:
                 search_time = int(user[3])
             except:
@@ -314,17 +502,18 @@ def game_loop():
             handler = None
           
             if user[1] == "alphabeta":
-                handler = handlers.AlphaBetaHandler(minimax.AlphaBeta(), 3, user[2], board, search_time, explain=True)
+                handler = handlers.AlphaBetaHandler(minimax.AlphaBeta(), 3, user[2], board, search_time, explain=True, stats="stats" in user or "log" in user)
             
             if not handler:
                 print("Please choose a specified engine.")
                 continue
 
-            success, result = handler.run()
+            success, result, stats = handler.run()
 
             if not success:
                 print(result)
             print(board.__str__())
+            show_stats(stats, user)
 
         if action == "undo":
             success, message = board.undo()
@@ -333,4 +522,5 @@ def game_loop():
                 continue
             print(board.__str__())
 
-game_loop()
\ No newline at end of file
+if __name__ == "__main__":
+    game_loop()
@@ -0,0 +1,131 @@
+import argparse
+import bisect
+import mmap
+import struct
+import sys
+import time
+from bitboard import Bitboard, canonical_crop, crop
+
+# file layout: header (magic, max_area, count), then count sorted little-endian uint64 entries.
+# an entry is the encoded position shifted left by one, with the low bit set if the player to move wins.
+# only the canonical_crop image of each position is stored, rotations and reflections are looked up through it.
+MAGIC = b"CLOBDB02"
+HEADER = struct.Struct("<8sII")
+# width and height take 5 bits each, enough for a 1 x MAX_AREA strip, and each mask MAX_AREA bits,
+# so an entry with its win bit fits in 63 bits
+DIMENSION_BITS = 5
+MAX_AREA = 26
+
+def encode(width, height, player, oppo):
+    return (((width << DIMENSION_BITS | height) << MAX_AREA | player) << MAX_AREA) | oppo
+
+class EndgameTable:
+    # read-only view of a database written by build(). the file is memory-mapped and entries are
+    # binary searched in place, so loading is instant and lookups copy nothing.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_area, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an endgame database")
+        # entries are read in native byte order straight from the map
+        if sys.byteorder != "little":
+            raise ValueError("endgame databases can only be read on little-endian machines")
+        self.entries = memoryview(self.map)[HEADER.size:HEADER.size + 8 * self.count].cast("Q")
+        self.hits = 0
+        self.probes = 0
+
+    def close(self):
+        self.entries.release()
+        self.map.close()
+        self.file.close()
+
+    def look_up(self, board):
+        # True if the player to move wins, False if they lose, None if the position is not stored.
+        # positions where the player to move has no moves, or with more pieces than the database
+        # was built for, are not stored.
+        if (board.player | board.oppo).bit_count() > self.max_area:
+            return None
+        width, height, player, oppo = crop(board.width, board.player, board.oppo)
+        if width * height > self.max_area:
+            return None
+        self.probes += 1
+        key = encode(*canonical_crop(width, height, player, oppo))
+        index = bisect.bisect_left(self.entries, key << 1)
+        if index < self.count and self.entries[index] >> 1 == key:
+            self.hits += 1
+            return bool(self.entries[index] & 1)
+        return None
+
+def solve(width, height, player, oppo, solved):
+    # True if the player to move wins the cropped position. solved caches every position visited.
+    key = encode(*canonical_crop(width, height, player, oppo))
+    if key in solved:
+        return solved[key]
+    board = Bitboard(width, height, player, oppo, (0, 0))
+    win = False
+    for origin, destination in board.moves():
+        after_player = oppo & ~(1 << destination)
+        after_oppo = (player & ~(1 << origin)) | (1 << destination)
+        if not solve(*crop(width, after_player, after_oppo), solved):
+            win = True
+            break
+    solved[key] = win
+    return win
+
+def positions(width, height, max_pieces):
+    # every position that fills its width x height bounding box, has at most max_pieces pieces and
+    # has a move for the player to move
+    area = width * height
+    full = (1 << area) - 1
+    first_row = (1 << width) - 1
+    last_row = first_row << (area - width)
+    first_col = sum(1 << (y * width) for y in range(height))
+    last_col = first_col << (width - 1)
+    for occupied in range(1, full + 1):
+        if not (occupied & first_row and occupied & last_row and occupied & first_col and occupied & last_col):
+            continue
+        if occupied.bit_count() > max_pieces:
+            continue
+        # every way of splitting the occupied squares between the two players
+        player = occupied
+        while True:
+            oppo = occupied ^ player
+            if player and oppo:
+                board = Bitboard(width, height, player, oppo, (0, 0))
+                if board.has_moves():
+                    yield player, oppo
+            if not player:
+                break
+            player = (player - 1) & occupied
+
+def build(path, max_area=12, max_pieces=MAX_AREA, verbose=False):
+    if max_area > MAX_AREA:
+        raise ValueError(f"max_area can be at most {MAX_AREA}")
+    solved = {}
+    entries = []
+    for width in range(1, max_area + 1):
+        for height in range(1, max_area // width + 1):
+            start = time.time()
+            count = len(entries)
+            for player, oppo in positions(width, height, max_pieces):
+                if canonical_crop(width, height, player, oppo) != (width, height, player, oppo):
+                    continue
+                win = solve(width, height, player, oppo, solved)
+                entries.append(encode(width, height, player, oppo) << 1 | win)
+            if verbose:
+                print(f"{width}x{height}: {len(entries) - count} positions in {time.time() - start:.1f}s")
+    entries.sort()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, max_area, len(entries)))
+        f.write(struct.pack(f"<{len(entries)}Q", *entries))
+    return len(entries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="solve every small clobber position and write an endgame database")
+    parser.add_argument("--max-area", type=int, default=12, help="largest bounding box area (cells) to solve")
+    parser.add_argument("--max-pieces", type=int, default=MAX_AREA, help="largest number of pieces to solve")
+    parser.add_argument("--out", default="endgame.db", help="output file")
+    args = parser.parse_args()
+    count = build(args.out, args.max_area, args.max_pieces, verbose=True)
+    print(f"wrote {count} positions to {args.out}")
@@ -1,5 +1,7 @@
 import math
 from minimax import Node, ABNode
+from transposition import TranspositionTable
+from stats import SearchStats
 from PrettyPrint import PrettyPrintTree
 import copy
 
@@ -10,86 +12,170 @@ class Handler:
         self.board = board
         self.print = print
         self.time = time
-        self.player_pieces = self.init_pieces(player)
-        self.oppo_pieces = self.init_pieces(self.opponent)
+        # SearchStats of the last run, None unless the handler was asked for stats
+        self.stats = None
 
-    def init_pieces(self, player):
-        if player == "o":
-            pieces = self.board.player_1.pieces
-        else:
-            pieces = self.board.player_2.pieces
-        return pieces
+    def init_board(self):
+        return self.board.snapshot(self.player)
 
     def run(self):
         pass
 
     def get_result(self, piece, destination):
         success, result = self.board.move(self.player, piece, destination)
-        return success, self.board.__str__()
+        return success, self.board.__str__(), self.stats
 
 
 class MinimaxHandler(Handler):
-    def __init__(self, minimax, player, board, time, print=False):
+    def __init__(self, minimax, player, board, time, print=False, stats=False):
         if print:
             super().__init__(player, board, time, print)
         else:
             super().__init__(player, board, time)
         self.minimax = minimax
         self.history = []
+        if stats:
+            self.stats = SearchStats()
+        self.minimax.stats = self.stats
     
     def run(self):
-        root = Node(-math.inf, "root", "max", None, self.player_pieces, self.oppo_pieces, [], self.board.height, self.board.width)
+        root = Node(-math.inf, "root", "max", None, self.init_board(), [])
+        if self.stats is not None:
+            self.stats.start(root.board, self.minimax.cache_counters())
         self.minimax.search(root)
+        if self.stats is not None:
+            self.stats.finish(self.minimax.nodes, self.minimax.cache_counters())
         best_node = self.minimax.get_best(root)
         piece, destination = best_node.parent_move
         return self.get_result(piece, destination)  
     
+class SolveHandler(Handler):
+    def __init__(self, solver, player, board, time, symmetry=False, stats=False):
+        super().__init__(player, board, time)
+        self.solver = solver
+        self.symmetry = symmetry
+        # True if the player wins with best play, False if they lose, None if time ran out first
+        self.outcome = None
+        if stats:
+            self.stats = SearchStats()
+        self.solver.stats = self.stats
+
+    def run(self):
+        board = self.init_board()
+        if self.symmetry:
+            board.enable_symmetry()
+        if self.stats is not None:
+            self.stats.start(board, self.solver.cache_counters())
+        self.outcome, move = self.solver.solve(board, self.time)
+        if self.solver.table is not None:
+            self.solver.table.flush()
+        if self.stats is not None:
+            self.stats.finish(self.solver.nodes, self.solver.cache_counters())
+        if move is None:
+            return False, "No moves available.", self.stats
+        piece, destination = board.to_coords(move)
+        return self.get_result(piece, destination)
+
+class MCTSHandler(Handler):
+    def __init__(self, mcts, player, board, time, playouts=math.inf, stats=False):
+        super().__init__(player, board, time)
+        self.mcts = mcts
+        self.playouts = playouts
+        # estimated chance that the player wins after the chosen move
+        self.win_rate = None
+        if stats:
+            self.stats = SearchStats()
+        self.mcts.stats = self.stats
+
+    def run(self):
+        board = self.init_board()
+        if self.stats is not None:
+            self.stats.start(board, self.mcts.cache_counters())
+        move, self.win_rate = self.mcts.search(board, self.time, self.playouts)
+        if self.stats is not None:
+            self.stats.finish(self.mcts.nodes, self.mcts.cache_counters())
+        if move is None:
+            return False, "No moves available.", self.stats
+        piece, destination = board.to_coords(move)
+        return self.get_result(piece, destination)
+
 class AlphaBetaHandler(Handler):
-    def __init__(self, ab, depth, player, board, time, explain=False, print=False):
+    def __init__(self, ab, depth, player, board, time, explain=False, print=False, table=False, symmetry=False, stats=False):
         if print:
             super().__init__(player, board, time, print)
         else:
             super().__init__(player, board, time)
         self.ab = ab
         self.depth = depth
-        self.dummy_node = ABNode("N/A", "N/A", "N/A", "...", "N/A", None, None, None, [], 0, 0)
+        self.dummy_node = ABNode("N/A", "N/A", "N/A", "...", "N/A", None, None, [])
         self.explain = explain
+        if explain:
+            self.ab.record()
+        # the random heuristic used by explain gives a different value every visit, so never cache it
+        if table and not explain and self.ab.table is None:
+            self.ab.table = TranspositionTable()
+        # search on a board that also hashes its mirror images, see Bitboard.enable_symmetry
+        self.symmetry = symmetry
+        if stats:
+            self.stats = SearchStats()
+        self.ab.stats = self.stats
     
     def run(self):
-        root = ABNode(-math.inf, 
-                      math.inf, 
-                      -math.inf, 
-                      "root", 
-                      "max", 
-                      None, 
-                      self.player_pieces, 
-                      self.oppo_pieces, 
-                      [], 
-                      self.board.height, 
-                      self.board.width)
-        if self.explain:
-            heuristic_fn = self.ab.random_heuristic
-        else:
-            heuristic_fn = self.ab.heuristic
-        self.ab.search(root, self.depth, -math.inf, math.inf, heuristic_fn)
-        best_node = self.ab.get_best(root)
-        piece, destination = best_node.parent_move
+        if self.ab.table is not None:
+            self.ab.table.new_search()
         if self.explain:
+            root = ABNode(-math.inf, 
+                          math.inf, 
+                          -math.inf, 
+                          "root", 
+                          "max", 
+                          None, 
+                          self.init_board(), 
+                          [])
+            if self.stats is not None:
+                self.stats.start(root.board, self.ab.cache_counters())
+            self.ab.search(root, self.depth, -math.inf, math.inf, self.ab.random_heuristic)
+            if self.stats is not None:
+                self.stats.finish(self.ab.nodes, self.ab.cache_counters())
+            best_node = self.ab.get_best(root)
+            piece, destination = best_node.parent_move
             self.show_steps()
+            return self.get_result(piece, destination)
+        # deepen up to self.depth, stopping early when self.time (ms) runs out. no tree is built.
+        board = self.init_board()
+        if self.symmetry:
+            board.enable_symmetry()
+        if self.stats is not None:
+            self.stats.start(board, self.ab.cache_counters())
+        value, pv = self.ab.iterative_deepening(board, self.depth, self.time)
+        if self.ab.table is not None:
+            self.ab.table.flush()
+        if self.stats is not None:
+            self.stats.finish(self.ab.nodes, self.ab.cache_counters())
+        if not pv:
+            return False, "No moves available.", self.stats
+        piece, destination = board.to_coords(pv[0])
         return self.get_result(piece, destination)
         
+    def hit_rate(self):
+        if self.ab.table is None:
+            return None
+        return self.ab.table.hit_rate()
+
     def show_steps(self):
-        history = self.ab.history
+        recorder = self.ab.recorder
+        if not len(recorder):
+            return
         index = 0
         command = input("press + to go forward, - to go back, and q to exit\n")
         while True:
             # replace this with function for handling pretty print
-            self.print_tree(history[index])
+            self.print_tree(recorder.frame(index))
             command = input()
             if command == "+":
-                index = (index + 1) % len(history)
+                index = (index + 1) % len(recorder)
             elif command == "-":
-                index = (index - 1) % len(history)
+                index = (index - 1) % len(recorder)
             elif command == "q":
                 break
         return
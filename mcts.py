@@ -0,0 +1,155 @@
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bitboard import Bitboard, neighbour_masks
+
+# exploration constant of the UCT formula
+EXPLORATION = math.sqrt(2)
+# leaves selected per worker in every round of a parallel search
+BATCH = 16
+
+def playout(board, player, oppo, rng, biased=False):
+    # plays random moves from (player, oppo), player to move, until someone cannot move.
+    # returns True if player makes the last move and wins
+    neighbours = neighbour_masks(board.width, board.height)
+    won = False
+    while True:
+        moves = board.moves(player, oppo)
+        if not moves:
+            return won
+        move = moves[rng.randrange(len(moves))]
+        if biased and len(moves) > 1:
+            # of two random captures, keep the one that leaves the capturing piece more to capture
+            other = moves[rng.randrange(len(moves))]
+            if (oppo & neighbours[other[1]]).bit_count() > (oppo & neighbours[move[1]]).bit_count():
+                move = other
+        origin, destination = move
+        player, oppo = oppo & ~(1 << destination), (player & ~(1 << origin)) | (1 << destination)
+        won = not won
+
+def run_playouts(width, height, positions, count, biased, seed):
+    # worker side of a parallel search: count playouts from every (player, oppo) in positions.
+    # returns the number won by the side to move in each
+    rng = random.Random(seed)
+    board = Bitboard(width, height, 0, 0, (0, 0))
+    return [sum(playout(board, player, oppo, rng, biased) for _ in range(count)) for player, oppo in positions]
+
+class Node:
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins")
+
+    def __init__(self, move, parent, untried):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        # legal moves that have no child yet
+        self.untried = untried
+        self.visits = 0
+        # playouts won by the player who made move, who chooses between this node and its siblings
+        self.wins = 0
+
+class MCTS:
+    # monte carlo tree search with UCT selection and random playouts. the tree lives in this
+    # process. with workers > 1 every round selects a batch of leaves, runs their playouts on a
+    # process pool and merges the results into the tree. the visits of a leaf are counted as soon
+    # as it is selected (a virtual loss), so the leaves of one round spread over the tree
+    def __init__(self, workers=1, biased=False, playouts_per_leaf=1, exploration=EXPLORATION, seed=None):
+        self.workers = workers or os.cpu_count()
+        # playouts prefer captures that leave the capturing piece more to capture, see playout
+        self.biased = biased
+        self.playouts_per_leaf = playouts_per_leaf
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.nodes = 0
+        self.playouts = 0
+        # optional stats.SearchStats. every selected leaf is counted as a leaf at its depth
+        self.stats = None
+
+    def cache_counters(self):
+        return {}
+
+    def search(self, board, search_time=math.inf, playout_limit=math.inf):
+        # runs playouts from board until search_time (ms) or playout_limit runs out, at least one
+        # round. returns (most visited move, its win rate), or (None, 0.0) if there are no moves
+        deadline = time.time() * 1000 + search_time
+        self.nodes = 1
+        self.playouts = 0
+        root = Node(None, None, board.moves())
+        if not root.untried:
+            return None, 0.0
+        if self.workers == 1:
+            while True:
+                leaf, leaf_board, depth = self.select(root, board)
+                self.backpropagate(leaf, self.simulate(leaf_board))
+                if self.playouts >= playout_limit or time.time() * 1000 > deadline:
+                    break
+        else:
+            with ProcessPoolExecutor(self.workers) as pool:
+                while True:
+                    self.parallel_round(pool, root, board, min(self.workers * BATCH, playout_limit - self.playouts))
+                    if self.playouts >= playout_limit or time.time() * 1000 > deadline:
+                        break
+        best = max(root.children, key=lambda child: child.visits)
+        return best.move, best.wins / best.visits
+
+    def parallel_round(self, pool, root, board, leaves):
+        selected = []
+        tasks = []
+        for _ in range(max(int(leaves / self.playouts_per_leaf), 1)):
+            leaf, leaf_board, depth = self.select(root, board)
+            if not leaf.untried and not leaf.children:
+                # the side to move has no moves and lost, there is nothing to play out
+                self.backpropagate(leaf, 0)
+                continue
+            selected.append(leaf)
+            tasks.append((leaf_board.player, leaf_board.oppo))
+        # one task per worker, each with its own seed so a seeded search is reproducible
+        size = -(-len(tasks) // self.workers)
+        futures = [pool.submit(run_playouts, board.width, board.height, tasks[i:i + size], self.playouts_per_leaf,
+                               self.biased, self.rng.getrandbits(32)) for i in range(0, len(tasks), size)]
+        results = [won for future in futures for won in future.result()]
+        for leaf, won in zip(selected, results):
+            self.backpropagate(leaf, won)
+
+    def select(self, root, board):
+        # walks down by UCT to a node with untried moves, adds a child for one of them and returns
+        # (new node, its board, depth). every node on the way is visited playouts_per_leaf times
+        board = board.copy()
+        node = root
+        depth = 0
+        node.visits += self.playouts_per_leaf
+        while not node.untried and node.children:
+            log_visits = math.log(node.visits)
+            node = max(node.children, key=lambda child: self.uct(child, log_visits))
+            board.do(node.move)
+            node.visits += self.playouts_per_leaf
+            depth += 1
+        if node.untried:
+            move = node.untried.pop(self.rng.randrange(len(node.untried)))
+            board.do(move)
+            child = Node(move, node, board.moves())
+            child.visits = self.playouts_per_leaf
+            node.children.append(child)
+            self.nodes += 1
+            node = child
+            depth += 1
+        if self.stats is not None:
+            self.stats.leaf(depth)
+        return node, board, depth
+
+    def uct(self, node, log_visits):
+        return node.wins / node.visits + self.exploration * math.sqrt(log_visits / node.visits)
+
+    def simulate(self, board):
+        # playouts won by the side to move in board
+        return sum(playout(board, board.player, board.oppo, self.rng, self.biased) for _ in range(self.playouts_per_leaf))
+
+    def backpropagate(self, node, won):
+        # won: playouts won by the side to move at node. the visits were counted by select
+        self.playouts += self.playouts_per_leaf
+        lost = self.playouts_per_leaf - won
+        while node is not None:
+            node.wins += lost
+            won, lost = lost, won
+            node = node.parent
@@ -1,58 +1,116 @@
 import math
 import numpy as np
 import random
-import copy
+import time
+from transposition import EXACT, LOWER, UPPER
+from bitboard import MobilityBitboard
+
+# half width of PVS's aspiration window, in units of the mobility heuristic
+ASPIRATION_WINDOW = 2
+# positions that took Solver fewer nodes than this are not worth writing to its table
+SOLVER_MIN_NODES = 64
+
+def masks_to_arrays(masks, width, height):
+    # stacks bitmasks of the same board size into an (n, height, width) boolean array
+    area = width * height
+    size = (area + 7) // 8
+    data = np.frombuffer(b"".join(mask.to_bytes(size, "little") for mask in masks), dtype=np.uint8)
+    data = np.unpackbits(data.reshape(len(masks), size), axis=1, bitorder="little")
+    return data[:, :area].reshape(len(masks), height, width).astype(bool)
+
+def batch_mobility(player, oppo):
+    # number of captures available to player in each stacked position
+    east = (player[:, :, :-1] & oppo[:, :, 1:]).sum(axis=(1, 2))
+    west = (player[:, :, 1:] & oppo[:, :, :-1]).sum(axis=(1, 2))
+    south = (player[:, :-1, :] & oppo[:, 1:, :]).sum(axis=(1, 2))
+    north = (player[:, 1:, :] & oppo[:, :-1, :]).sum(axis=(1, 2))
+    return east + west + south + north
 
 class Node:
-    def __init__(self, value, label, player, parent, player_pieces, oppo_pieces, parent_move, height, width):
+    def __init__(self, value, label, player, parent, board, parent_move):
         self.label = label
         self.children = []
         # set value according to which player
         self.value = value
         self.parent = parent
         self.player = player
-        self.player_pieces = player_pieces
-        self.oppo_pieces = oppo_pieces
+        # bitboard with the pieces of the player to move at this node as board.player
+        self.board = board
         self.parent_move = parent_move
-        self.height = height
-        self.width = width
-    
+
+    @property
+    def player_pieces(self):
+        return self.board.player_pieces
+
+    @property
+    def oppo_pieces(self):
+        return self.board.oppo_pieces
+
+    @property
+    def height(self):
+        return self.board.height
+
+    @property
+    def width(self):
+        return self.board.width
+
     def position(self, player, opponent):
-        result = ["  "]
-        alphabet = list("abcdefghijklmnopqrstuvwxyz")
-        result.append(" ".join(alphabet[:self.width]))
-        result.append('\n')
-        for y in range(self.height):
-            result.append(f"{y + 1} ")
-            for x in range(self.width):
-                if (x, y) in self.player_pieces:
-                    result.append(player)
-                elif (x, y) in self.oppo_pieces:
-                    result.append(opponent)
-                else:
-                    result.append('.')
-                result.append(' ')
-            result.append('\n')
-        return ''.join(result)
+        return self.board.position(player, opponent)
 
 class Minimax:
-    def __init__(self):
-        pass
+    def __init__(self, decomposer=None, endgame=None):
+        # optional cgt.Decomposer that solves positions made of small enough components exactly
+        self.decomposer = decomposer
+        # optional endgame.EndgameTable with the results of small positions
+        self.endgame = endgame
+        self.nodes = 0
+        # optional stats.SearchStats filled in while searching
+        self.stats = None
 
-    def available_moves(self, player, oppo):
-        moves = []
-        neighbors = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        for piece in player:
-            for neighbor in neighbors:
-                cell = tuple(sum(t) for t in zip(piece, neighbor))
-                if cell in oppo:
-                    moves.append([piece, cell])
-        return moves
+    def cache_counters(self):
+        # cache name -> (hits, probes) so far, for SearchStats
+        counters = {}
+        if self.endgame is not None:
+            counters["endgame"] = (self.endgame.hits, self.endgame.probes)
+        if self.decomposer is not None:
+            counters["cgt"] = (self.decomposer.hits, self.decomposer.hits + self.decomposer.misses)
+        return counters
+
+    def outcome(self, board):
+        # True if the player to move wins, False if they lose, None if board has to be searched
+        if self.endgame is not None:
+            outcome = self.endgame.look_up(board)
+            if outcome is not None:
+                return outcome
+        if self.decomposer is not None:
+            return self.decomposer.outcome(board)
+        return None
+
+    def exact_value(self, node):
+        # exact value of node (from max's point of view) if it is solved without searching
+        outcome = self.outcome(node.board)
+        if outcome is None:
+            return None
+        return math.inf if outcome == (node.player == "max") else -math.inf
+
+    def available_moves(self, board):
+        return board.moves()
 
     def search(self, node):
+        self.nodes += 1
+        # the root is always searched so that it has children to pick a move from
+        if node.parent:
+            value = self.exact_value(node)
+            if value is not None:
+                if self.stats is not None:
+                    self.stats.leaf(self.stats.ply(node.board))
+                node.value = value
+                return value
         # expand node to get children
         self.expand(node)
         if not node.children:
+            if self.stats is not None:
+                self.stats.leaf(self.stats.ply(node.board))
             if node.player == "max":
                 value = -math.inf
             else:
@@ -87,16 +145,13 @@ class Minimax:
             # get child node with smallest value
             smallest_val = math.inf
             for child in node.children:
-                if child.value >= smallest_val:
+                if child.value <= smallest_val:
                     smallest_val = child.value
                     best = child
         return best
         
-    def make_move(self, player, oppo, move):
-        player.remove(move[0])
-        player.append(move[1])
-        oppo.remove(move[1])
-        return player, oppo
+    def make_move(self, board, move):
+        return board.play(move)
     
     def move_to_coords(self, move):
         alphabet = 'abcdefghijklmnopqrstuvwxyz'
@@ -109,104 +164,459 @@ class Minimax:
         types = ["max", "min"]
         node_type = types[0] if node.player == types[1] else types[1]
         value = None
-        moves = self.available_moves(node.player_pieces, node.oppo_pieces)
+        moves = self.available_moves(node.board)
         if not moves:
             return
+        if node.parent is None:
+            # moves that mirror each other in a symmetric root position lead to equal subtrees
+            moves = node.board.unique_moves(moves)
         for move in moves:
-            oppo, player = self.make_move(node.player_pieces.copy(), node.oppo_pieces.copy(), move)
-            new_node = Node(value, self.move_to_coords(move), node_type, node, player, oppo, move, node.height, node.width)
+            coords = node.board.to_coords(move)
+            new_node = Node(value, self.move_to_coords(coords), node_type, node, self.make_move(node.board, move), coords)
             node.children.append(new_node)
         return
     
 class ABNode(Node):
-    def __init__(self, alpha, beta, value, label, player, parent, player_pieces, oppo_pieces, parent_move, height, width):
-        super().__init__(value, label, player, parent, player_pieces, oppo_pieces, parent_move, height, width)
+    def __init__(self, alpha, beta, value, label, player, parent, board, parent_move):
+        super().__init__(value, label, player, parent, board, parent_move)
         self.alpha = alpha
         self.beta = beta
+        # child that produced value, set once the node has been searched
+        self.best = None
+        # TraceRecorder clock when the search entered and left the node, and its value before the
+        # search changed it. only set while tracing
+        self.entered = None
+        self.exited = None
+        self.entry_value = None
 
-class AlphaBeta(Minimax):
-    def __init__(self):
-        super().__init__()
-        self.history = []
-
-    @staticmethod
-    def trace(fn):
-        def wrapper(self, *args, **kwargs):
-            node = args[0]
-            depth = args[1]
-            alpha = args[2]
-            beta = args[3]
-            if len(self.history) < 50 and depth >= 0 and node.parent:
-                node_copy = copy.deepcopy(node.parent)
-                node_copy.alpha = alpha
-                node_copy.beta = beta
-                self.history.append([node_copy, depth, node])
+class SearchTimeout(Exception):
+    pass
+
+class TraceRecorder:
+    # records the calls of a tree search as compact events (node, depth, alpha, beta, clock) in a
+    # preallocated ring buffer that keeps the latest capacity events. nothing is copied while
+    # searching: every node of the tree is searched once, so the clock values at which nodes were
+    # entered and left are enough to rebuild the tree as it was at any event.
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.events = [None] * capacity
+        self.count = 0
+        self.clock = 0
+
+    def wrap(self, search):
+        def traced(node, depth, alpha, beta, heuristic_fn):
+            self.clock += 1
+            node.entered = self.clock
+            node.entry_value = node.value
+            # same steps as explain always showed: entering every node below the root, and leaving
+            # every one that is not a leaf
+            if depth >= 0 and node.parent:
+                self.add(node, depth, alpha, beta)
             try:
-                return fn(self, *args, **kwargs)
+                return search(node, depth, alpha, beta, heuristic_fn)
             finally:
-                if len(self.history) < 50 and depth > 0:
-                    node_copy = copy.deepcopy(node.parent)
-                    node_copy.alpha = alpha
-                    node_copy.beta = beta
-                    self.history.append([node_copy, depth, node])
-        return wrapper
+                self.clock += 1
+                node.exited = self.clock
+                if depth > 0 and node.parent:
+                    self.add(node, depth, alpha, beta)
+        return traced
+
+    def add(self, node, depth, alpha, beta):
+        self.events[self.count % self.capacity] = (node, depth, alpha, beta, self.clock)
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def frame(self, index):
+        # (parent of the node as it was at event index, with the alpha and beta of the call, depth, node).
+        # index 0 is the oldest event still in the buffer
+        first = max(0, self.count - self.capacity)
+        node, depth, alpha, beta, clock = self.events[(first + index) % self.capacity]
+        parent = self.snapshot(node.parent, clock, 2)
+        parent.alpha = alpha
+        parent.beta = beta
+        return parent, depth, node
+
+    def snapshot(self, node, clock, levels):
+        # copy of node and levels of its descendants at clock. search only sets a node's value as it
+        # leaves the node and expands it right after entering, so both follow from the clock values
+        value = node.value
+        if node.entered is not None and (node.exited is None or node.exited > clock):
+            value = node.entry_value
+        copy = ABNode(node.alpha, node.beta, value, node.label, node.player, None, node.board, node.parent_move)
+        if levels > 0 and node.entered is not None and node.entered < clock:
+            copy.children = [self.snapshot(child, clock, levels - 1) for child in node.children]
+        return copy
+
+class AlphaBeta(Minimax):
+    def __init__(self, table=None, decomposer=None, endgame=None, ordering=True, static_ordering=False, batch_threshold=48):
+        super().__init__(decomposer, endgame)
+        # TraceRecorder of the tree search, see record
+        self.recorder = None
+        # depth 1 nodes with at least this many moves and no upper bound evaluate all their children
+        # at once with numpy (see evaluate_children). None turns it off
+        self.batch_threshold = batch_threshold
+        # move ordering for negamax: killer moves per ply and a history table of moves that caused
+        # cutoffs, optionally with "leave the opponent the fewest replies" to break ties
+        self.ordering = ordering
+        self.static_ordering = static_ordering
+        self.killers = {}
+        self.history_scores = {}
+        # beta cutoffs, and how many of them came from the first move searched
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        # optional transposition table shared by every call to search
+        self.table = table
+        # search budget, only enforced while budget is True (see iterative_deepening)
+        self.budget = False
+        self.deadline = math.inf
+        self.node_limit = math.inf
+        self.nodes = 0
+        # position hash -> move of the previous iteration's principal variation
+        self.pv = {}
+        self.completed_depth = 0
+        self.horizon = False
+
+    def record(self, capacity=1000):
+        # traces every call of the tree search into a TraceRecorder for explain. only this engine's
+        # search is wrapped, so searches that are not recorded run with no tracing code at all
+        self.recorder = TraceRecorder(capacity)
+        self.search = self.recorder.wrap(self.search)
+        return self.recorder
 
     # alpha is tracking the minimum value that Max can achieve (thus far)
     # beta is tracking maximum value the Min can achieve (thus far)
-    @trace
     def search(self, node, depth, alpha, beta, heuristic_fn):
+        self.nodes += 1
+        if self.budget and (self.nodes > self.node_limit or (self.nodes % 256 == 0 and time.time() * 1000 > self.deadline)):
+            raise SearchTimeout()
+        if node.parent:
+            value = self.exact_value(node)
+            if value is not None:
+                if self.stats is not None:
+                    self.stats.leaf(self.stats.ply(node.board))
+                node.value = value
+                return value
         if depth == 0:
+            self.horizon = True
+            if self.stats is not None:
+                self.stats.leaf(self.stats.ply(node.board))
             node.value = heuristic_fn(node)
             return node.value
+        alpha_orig = alpha
+        beta_orig = beta
+        table_move = None
+        if self.table is not None:
+            entry = self.table.look_up(node.board.hash)
+            if entry is not None:
+                table_move = entry[4]
+                # never cut at the root, its children are needed to pick a move
+                if entry[2] >= depth and node.parent:
+                    value, bound = self.flip_for_player(node, entry[1], entry[3])
+                    if bound == LOWER:
+                        alpha = max(alpha, value)
+                    elif bound == UPPER:
+                        beta = min(beta, value)
+                    if bound == EXACT or alpha >= beta:
+                        node.value = value
+                        return value
         # expand node to get children
         self.expand(node)
         if not node.children:
+            if self.stats is not None:
+                self.stats.leaf(self.stats.ply(node.board))
             if node.player == "max":
                 value = -math.inf
             else:
                 value = math.inf
             node.value = value
             return value
+        if table_move is not None:
+            self.order_first(node, table_move)
+        best = None
         if node.player == "max":
             value = -math.inf
             for child in node.children:
-                value = max(value, self.search(child, depth - 1, alpha, beta, heuristic_fn))
+                child_value = self.search(child, depth - 1, alpha, beta, heuristic_fn)
+                if best is None or child_value > value:
+                    value = child_value
+                    best = child
                 if value >= beta:
+                    if self.stats is not None:
+                        self.stats.cutoff(self.stats.ply(node.board), child is node.children[0])
                     break
                 alpha = max(alpha, value)
-            node.value = value
-            return value
         else:
             value = math.inf
             for child in node.children:
-                value = min(value, self.search(child, depth - 1, alpha, beta, heuristic_fn))
+                child_value = self.search(child, depth - 1, alpha, beta, heuristic_fn)
+                if best is None or child_value < value:
+                    value = child_value
+                    best = child
                 if value <= alpha:
+                    if self.stats is not None:
+                        self.stats.cutoff(self.stats.ply(node.board), child is node.children[0])
                     break
                 beta = min(beta, value)
-            node.value = value
-            return value
-        
+        node.value = value
+        node.best = best
+        if self.table is not None:
+            if value <= alpha_orig:
+                bound = UPPER
+            elif value >= beta_orig:
+                bound = LOWER
+            else:
+                bound = EXACT
+            stored, bound = self.flip_for_player(node, value, bound)
+            self.table.store(node.board.hash, stored, depth, bound, node.board.from_coords(best.parent_move))
+        return value
+
+    def negamax(self, board, depth, alpha, beta, ply=0):
+        # make/unmake search: moves are played and undone on the one shared board and no nodes are
+        # kept. values are for the player to move. returns (value, principal variation)
+        self.nodes += 1
+        if self.budget and (self.nodes > self.node_limit or (self.nodes % 256 == 0 and time.time() * 1000 > self.deadline)):
+            raise SearchTimeout()
+        if depth == 0:
+            self.horizon = True
+            if self.stats is not None:
+                self.stats.leaf(ply)
+            return self.evaluate(board), []
+        alpha_orig = alpha
+        table_move = None
+        if self.table is not None:
+            # symmetric positions share one entry, its move is stored in the canonical image's frame
+            key, transform = board.canonical()
+            entry = self.table.look_up(key)
+            if entry is not None:
+                table_move = board.from_canonical(entry[4], transform)
+                if entry[2] >= depth:
+                    value, bound = entry[1], entry[3]
+                    if bound == LOWER:
+                        alpha = max(alpha, value)
+                    elif bound == UPPER:
+                        beta = min(beta, value)
+                    if bound == EXACT or alpha >= beta:
+                        # a finite value came from a search that stopped at its depth limit
+                        if abs(value) != math.inf:
+                            self.horizon = True
+                        return value, [table_move]
+        moves = board.moves()
+        if not moves:
+            if self.stats is not None:
+                self.stats.leaf(ply)
+            return -math.inf, []
+        # comparing the symmetric hashes makes the check cheap enough for every node, without them
+        # only the root is checked
+        if ply == 0 or board.symmetric_hashes is not None:
+            moves = board.unique_moves(moves)
+        self.order_moves(board, moves, ply, table_move)
+        value = -math.inf
+        pv = []
+        # with beta = inf no leaf can cut the loop short, so batching skips no work the loop would
+        # have skipped. with a finite beta the loop usually stops after a child or two, while the
+        # batch scores all of them: on the 8x8 start, depth 4 took 298k nodes and 1.05s batched
+        # against 19.7k nodes and 0.33s serially
+        if (depth == 1 and beta == math.inf and self.batch_threshold is not None and len(moves) >= self.batch_threshold
+                and self.endgame is None and self.decomposer is None):
+            value, pv = self.evaluate_children(board, moves)
+            if self.stats is not None:
+                self.stats.leaf(ply + 1, len(moves))
+        else:
+            for index, move in enumerate(moves):
+                board.do(move)
+                outcome = self.outcome(board)
+                if outcome is None:
+                    child_value, child_pv = self.search_child(board, index, depth - 1, alpha, beta, ply + 1)
+                else:
+                    # the child is in the endgame table or splits into components small enough to solve
+                    child_value, child_pv = (math.inf if outcome else -math.inf), []
+                    self.nodes += 1
+                    if self.stats is not None:
+                        self.stats.leaf(ply + 1)
+                board.undo(move)
+                if not pv or -child_value > value:
+                    value = -child_value
+                    pv = [move] + child_pv
+                if value >= beta:
+                    self.record_cutoff(move, depth, ply, index)
+                    break
+                alpha = max(alpha, value)
+        if self.table is not None:
+            if value <= alpha_orig:
+                bound = UPPER
+            elif value >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            self.table.store(key, value, depth, bound, board.to_canonical(pv[0], transform))
+        return value, pv
+
+    def search_child(self, board, index, depth, alpha, beta, ply):
+        # searches the position after the index-th move of a node searched with (alpha, beta).
+        # returns (value, pv) of the child, for the child's player to move
+        return self.negamax(board, depth, -beta, -alpha, ply)
+
+    def search_root(self, board, depth, previous):
+        # one iteration of iterative_deepening. previous is the last iteration's value, None at depth 1
+        return self.negamax(board, depth, -math.inf, math.inf)
+
+    def evaluate_children(self, board, moves):
+        # evaluates every child of a depth 1 node in one batch of array operations instead of one
+        # negamax call per leaf. returns (value, pv) as negamax would for a window with beta = inf
+        players = []
+        oppos = []
+        for origin, destination in moves:
+            players.append(board.oppo & ~(1 << destination))
+            oppos.append((board.player & ~(1 << origin)) | (1 << destination))
+        player = masks_to_arrays(players, board.width, board.height)
+        oppo = masks_to_arrays(oppos, board.width, board.height)
+        # evaluate() of each child, negated for the player to move here
+        values = batch_mobility(oppo, player) - batch_mobility(player, oppo)
+        best = int(np.argmax(values))
+        self.nodes += len(moves)
+        self.horizon = True
+        return int(values[best]), [moves[best]]
+
+    def order_moves(self, board, moves, ply, table_move):
+        # sorts moves in place: table move, then principal variation move, then killers for this ply,
+        # then the rest by history score
+        if self.ordering:
+            if self.static_ordering:
+                moves.sort(key=lambda move: (self.history_scores.get(move, 0), -self.replies(board, move)), reverse=True)
+            else:
+                moves.sort(key=lambda move: self.history_scores.get(move, 0), reverse=True)
+            for move in reversed(self.killers.get(ply, ())):
+                if move in moves:
+                    moves.remove(move)
+                    moves.insert(0, move)
+        for move in (self.pv.get(board.hash), table_move):
+            if move is not None and move in moves:
+                moves.remove(move)
+                moves.insert(0, move)
+
+    def replies(self, board, move):
+        board.do(move)
+        replies = board.count_moves()
+        board.undo(move)
+        return replies
+
+    def record_cutoff(self, move, depth, ply, index):
+        self.cutoffs += 1
+        if self.stats is not None:
+            self.stats.cutoff(ply, index == 0)
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if not self.ordering:
+            return
+        killers = self.killers.get(ply, [])
+        if move not in killers:
+            self.killers[ply] = [move] + killers[:1]
+        self.history_scores[move] = self.history_scores.get(move, 0) + depth * depth
+
+    def cache_counters(self):
+        counters = super().cache_counters()
+        if self.table is not None:
+            counters["tt"] = (self.table.hits, self.table.probes)
+        return counters
+
+    def first_move_cutoff_rate(self):
+        if not self.cutoffs:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+    def iterative_deepening(self, board, max_depth, search_time=math.inf, node_limit=math.inf):
+        # runs negamax to depth 1, 2, ... up to max_depth until search_time (ms) or node_limit runs out.
+        # an iteration that runs out of budget is thrown away, and (value, principal variation) of the
+        # last completed iteration is returned. depth 1 always completes so there is always a move.
+        self.deadline = time.time() * 1000 + search_time
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.pv = {}
+        self.completed_depth = 0
+        self.killers = {}
+        self.history_scores = {}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        result = None
+        depth = 1
+        while depth <= max_depth:
+            self.budget = depth > 1
+            self.horizon = False
+            start = time.perf_counter()
+            start_nodes = self.nodes
+            try:
+                # an aborted iteration leaves its board half played, so search a copy. the copy
+                # keeps its mobility up to date as moves are played, which makes leaves cheap
+                value, pv = self.search_root(MobilityBitboard.from_board(board), depth, result[0] if result else None)
+            except SearchTimeout:
+                break
+            finally:
+                self.budget = False
+            result = (value, pv)
+            self.completed_depth = depth
+            if self.stats is not None:
+                self.stats.iteration(depth, time.perf_counter() - start, self.nodes - start_nodes)
+            self.pv = self.principal_variation(board, pv)
+            # stop once the game is solved or no leaf was cut off by the depth limit
+            if abs(value) == math.inf or not self.horizon:
+                break
+            depth += 1
+        return result
+
+    def principal_variation(self, board, pv):
+        # position hash -> move played there along pv
+        positions = {}
+        for move in pv:
+            positions[board.hash] = move
+            board = board.play(move)
+        return positions
+
+    def get_best(self, node):
+        if node.best is not None:
+            return node.best
+        return super().get_best(node)
+
+    def flip_for_player(self, node, value, bound):
+        # search values are from max's point of view, the table's are from the player to move.
+        # the conversion is its own inverse.
+        if node.player == "max":
+            return value, bound
+        if bound == LOWER:
+            bound = UPPER
+        elif bound == UPPER:
+            bound = LOWER
+        return -value, bound
+
+    def order_first(self, node, move):
+        # move the child reached by move to the front of node.children
+        coords = node.board.to_coords(move)
+        for index, child in enumerate(node.children):
+            if child.parent_move == coords:
+                node.children.insert(0, node.children.pop(index))
+                return
+
     def expand(self, node):
         moves = []
         types = ["max", "min"]
         node_type = types[0] if node.player == types[1] else types[1]
         value = None
-        moves = self.available_moves(node.player_pieces, node.oppo_pieces)
+        moves = self.available_moves(node.board)
         if not moves:
             return
+        if node.parent is None:
+            moves = node.board.unique_moves(moves)
         for move in moves:
-            oppo, player = self.make_move(node.player_pieces.copy(), node.oppo_pieces.copy(), move)
+            coords = node.board.to_coords(move)
             new_node = ABNode(node.alpha, 
                               node.beta, 
                               value, 
-                              self.move_to_coords(move), 
+                              self.move_to_coords(coords), 
                               node_type, 
                               node, 
-                              player, 
-                              oppo, 
-                              move, 
-                              node.height, 
-                              node.width)
+                              self.make_move(node.board, move), 
+                              coords)
             node.children.append(new_node)
         return
     
@@ -216,11 +626,158 @@ class AlphaBeta(Minimax):
     # stupid heuristic that just looks at available moves 
     def heuristic(self, node):
         #matrix = self.board_to_matrix(node)
-        value = 0
-        player_moves = len(self.available_moves(node.player_pieces, node.oppo_pieces))
-        oppo_moves = len(self.available_moves(node.oppo_pieces, node.player_pieces))
+        value = self.evaluate(node.board)
         if node.player == "max":
-            value = player_moves - oppo_moves
-        else:
-            value = oppo_moves - player_moves
-        return value
+            return value
+        return -value
+
+    # the same heuristic for the player to move in board. O(1) on a MobilityBitboard
+    def evaluate(self, board):
+        player_moves, oppo_moves = board.mobility()
+        return player_moves - oppo_moves
+
+class PVS(AlphaBeta):
+    # principal variation search (negascout). with good move ordering the first move of a node is
+    # usually its best, so every later move is only tested with a null window (alpha, alpha + 1)
+    # and searched again with the real window if it turns out better. iterations of
+    # iterative_deepening start with a narrow window around the previous value. values and
+    # principal variations are the same as AlphaBeta.negamax's, heuristic values are integers
+    def __init__(self, table=None, decomposer=None, endgame=None, ordering=True, static_ordering=False, batch_threshold=48,
+                 aspiration=ASPIRATION_WINDOW):
+        super().__init__(table, decomposer, endgame, ordering, static_ordering, batch_threshold)
+        # half width of the root's window around the previous iteration's value
+        self.aspiration = aspiration
+        # null window searches that failed high and were searched again, and root searches that
+        # fell outside the aspiration window
+        self.researches = 0
+        self.aspiration_failures = 0
+
+    def iterative_deepening(self, board, max_depth, search_time=math.inf, node_limit=math.inf):
+        self.researches = 0
+        self.aspiration_failures = 0
+        return super().iterative_deepening(board, max_depth, search_time, node_limit)
+
+    def search_child(self, board, index, depth, alpha, beta, ply):
+        # the window is already null, or there is no bound to test against yet
+        if index == 0 or alpha == -math.inf or beta - alpha <= 1:
+            return self.negamax(board, depth, -beta, -alpha, ply)
+        value, pv = self.negamax(board, depth, -alpha - 1, -alpha, ply)
+        if alpha < -value < beta:
+            # fail high: the move beats alpha by at least -value, find out by how much
+            self.researches += 1
+            value, pv = self.negamax(board, depth, -beta, value, ply)
+        return value, pv
+
+    def search_root(self, board, depth, previous):
+        if previous is None or abs(previous) == math.inf:
+            return self.negamax(board, depth, -math.inf, math.inf)
+        alpha = previous - self.aspiration
+        beta = previous + self.aspiration
+        while True:
+            value, pv = self.negamax(board, depth, alpha, beta)
+            # outside the window the value is only a bound, so open that side and search again
+            if value <= alpha and alpha != -math.inf:
+                alpha = -math.inf
+            elif value >= beta and beta != math.inf:
+                beta = math.inf
+            else:
+                return value, pv
+            self.aspiration_failures += 1
+
+class Solver(Minimax):
+    # decides who wins with a boolean negamax. clobber has no draws, so a position is won exactly
+    # when some move leaves the opponent a lost position, and the first such move ends the search
+    # of a node. moves are played and undone on one board and no nodes are kept, only the outcome
+    # of every searched position. boards are searched as MobilityBitboards
+    def __init__(self, decomposer=None, endgame=None, table=None, min_nodes=SOLVER_MIN_NODES):
+        super().__init__(decomposer, endgame)
+        # position key -> True if the player to move wins. symmetric positions share a key
+        self.solved = {}
+        self.hits = 0
+        self.probes = 0
+        self.deadline = math.inf
+        # optional transposition table (e.g. a transposition.PersistentTable) that is asked for
+        # positions not in solved, and told the outcome of every position that took at least
+        # min_nodes nodes to solve
+        self.table = table
+        self.min_nodes = min_nodes
+
+    def cache_counters(self):
+        counters = super().cache_counters()
+        counters["solved"] = (self.hits, self.probes)
+        if self.table is not None:
+            counters["tt"] = (self.table.hits, self.table.probes)
+        return counters
+
+    def solve(self, board, search_time=math.inf):
+        # (True if the player to move wins, move to play) for board, or (None, first move) if
+        # search_time (ms) runs out first. the move wins when there is a winning move
+        self.deadline = time.time() * 1000 + search_time
+        self.nodes = 0
+        moves = board.moves()
+        if not moves:
+            return False, None
+        board = MobilityBitboard.from_board(board)
+        moves = board.unique_moves(moves)
+        moves.sort(key=board.contact_change)
+        try:
+            for move in moves:
+                board.do(move)
+                won = self.wins(board, 1)
+                board.undo(move)
+                if not won:
+                    return True, move
+        except SearchTimeout:
+            return None, moves[0]
+        return False, moves[0]
+
+    def wins(self, board, ply):
+        self.nodes += 1
+        if self.nodes % 256 == 0 and time.time() * 1000 > self.deadline:
+            raise SearchTimeout()
+        outcome = self.outcome(board)
+        if outcome is not None:
+            if self.stats is not None:
+                self.stats.leaf(ply)
+            return outcome
+        key = board.canonical()[0]
+        self.probes += 1
+        if key in self.solved:
+            self.hits += 1
+            if self.stats is not None:
+                self.stats.leaf(ply)
+            return self.solved[key]
+        if self.table is not None:
+            entry = self.table.look_up(key)
+            # a win is a lower bound of inf and a loss an upper bound of -inf, whatever the depth
+            if entry is not None and abs(entry[1]) == math.inf and entry[3] != (UPPER if entry[1] > 0 else LOWER):
+                self.solved[key] = entry[1] > 0
+                if self.stats is not None:
+                    self.stats.leaf(ply)
+                return self.solved[key]
+        start = self.nodes
+        moves = board.moves()
+        if not moves and self.stats is not None:
+            self.stats.leaf(ply)
+        won = False
+        if board.symmetric_hashes is not None:
+            moves = board.unique_moves(moves)
+        # a move that leaves the opponent few replies is the most likely to win, and the cheapest
+        # to refute if it does not
+        moves.sort(key=board.contact_change)
+        for move in moves:
+            board.do(move)
+            won = not self.wins(board, ply + 1)
+            board.undo(move)
+            if won:
+                if self.stats is not None:
+                    self.stats.cutoff(ply, move is moves[0])
+                break
+        self.solved[key] = won
+        if self.table is not None and moves and self.nodes - start >= self.min_nodes:
+            # no game from here lasts more moves than there are pieces, so the outcome holds to that
+            # depth. a lost position has no best move, the table gets the first one tried
+            transform = board.canonical()[1]
+            self.table.store(key, math.inf if won else -math.inf, (board.player | board.oppo).bit_count(), EXACT,
+                             board.to_canonical(move if won else moves[0], transform))
+        return won
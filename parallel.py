@@ -0,0 +1,144 @@
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from bitboard import MobilityBitboard
+from minimax import AlphaBeta, SearchTimeout
+from transposition import TranspositionTable
+
+# per worker process state, set up by init_worker
+_shared_alpha = None
+_table = None
+
+def init_worker(shared_alpha, table):
+    global _shared_alpha, _table
+    _shared_alpha = shared_alpha
+    # each worker keeps its own table for the life of the pool, so later iterations reuse it
+    if table:
+        _table = TranspositionTable()
+
+def raise_alpha(value):
+    with _shared_alpha.get_lock():
+        if value > _shared_alpha.value:
+            _shared_alpha.value = value
+
+def search_move(width, height, player, oppo, symmetry, move, depth, deadline):
+    # searches one root move to depth. the root's alpha is read from shared memory before every
+    # reply, so a bound found by another worker cuts this search short as soon as it is published.
+    # returns (value for the root player, exact, pv, nodes), or None if the deadline passed.
+    ab = AlphaBeta(_table)
+    ab.budget = True
+    ab.deadline = deadline
+    board = MobilityBitboard(width, height, player, oppo)
+    if symmetry:
+        board.enable_symmetry()
+    board.do(move)
+    try:
+        value, exact, pv = refute(ab, board, depth - 1)
+    except SearchTimeout:
+        return None
+    if exact:
+        raise_alpha(value)
+    return value, exact, [move] + pv, ab.nodes
+
+def refute(ab, board, depth):
+    # negamax over the opponent's replies with the root window (alpha, inf), refreshing alpha
+    # between replies. returns the root player's value, whether it is exact and the pv after the move
+    moves = board.moves()
+    if depth == 0 or not moves:
+        value, pv = ab.negamax(board, depth, -math.inf, -_shared_alpha.value, 1)
+        return -value, -value > _shared_alpha.value, pv
+    best = -math.inf
+    pv = []
+    for move in moves:
+        beta = -_shared_alpha.value
+        if best >= beta:
+            # this move can no longer beat the best root move
+            return -best, False, pv
+        board.do(move)
+        value, child_pv = ab.negamax(board, depth - 1, -beta, -best, 2)
+        board.undo(move)
+        if not pv or -value > best:
+            best = -value
+            pv = [move] + child_pv
+    return -best, best < -_shared_alpha.value, pv
+
+class ParallelAlphaBeta:
+    # root-parallel alpha-beta over a process pool. the first root move is searched alone to get
+    # a bound (young brothers wait), then the remaining moves are searched in parallel while the
+    # workers share the root's alpha. values match the serial AlphaBeta.negamax at the same depth,
+    # and the move played has that value. with table=True every worker keeps a transposition table.
+    def __init__(self, workers=None, table=False):
+        self.workers = workers or os.cpu_count()
+        self.use_table = table
+        # AlphaBetaHandler reports the hit rate of ab.table, the workers' tables are not visible
+        self.table = None
+        self.nodes = 0
+        self.completed_depth = 0
+        # optional stats.SearchStats. only nodes and iterations are counted, the workers' searches
+        # are not visible
+        self.stats = None
+
+    def cache_counters(self):
+        return {}
+
+    def search(self, pool, shared_alpha, board, moves, depth, deadline):
+        # returns (value, pv) for board searched to depth, trying moves in the given order
+        shared_alpha.value = -math.inf
+        args = (board.width, board.height, board.player, board.oppo, board.symmetric_hashes is not None)
+        first = pool.submit(search_move, *args, moves[0], depth, deadline).result()
+        if first is None:
+            raise SearchTimeout()
+        results = {0: first}
+        pending = {pool.submit(search_move, *args, move, depth, deadline): index for index, move in enumerate(moves) if index}
+        while pending:
+            done, running = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is None:
+                    for other in running:
+                        other.cancel()
+                    raise SearchTimeout()
+                results[pending.pop(future)] = result
+        self.nodes += sum(result[3] for result in results.values())
+        # same choice as the serial search: the first move, in search order, with the best exact value
+        value = max(result[0] for result in results.values())
+        for index in range(len(moves)):
+            if results[index][0] == value and results[index][1]:
+                return value, results[index][2]
+        return value, results[0][2]
+
+    def iterative_deepening(self, board, max_depth, search_time=math.inf, node_limit=math.inf):
+        # same contract as AlphaBeta.iterative_deepening. node_limit is not enforced across processes.
+        deadline = time.time() * 1000 + search_time
+        self.nodes = 0
+        self.completed_depth = 0
+        moves = board.moves()
+        if not moves:
+            return -math.inf, []
+        moves = board.unique_moves(moves)
+        result = None
+        shared_alpha = multiprocessing.Value("d", -math.inf)
+        with ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(shared_alpha, self.use_table)) as pool:
+            depth = 1
+            while depth <= max_depth:
+                start = time.perf_counter()
+                start_nodes = self.nodes
+                try:
+                    # depth 1 always completes so there is always a move
+                    value, pv = self.search(pool, shared_alpha, board, moves, depth, deadline if depth > 1 else math.inf)
+                except SearchTimeout:
+                    break
+                result = (value, pv)
+                self.completed_depth = depth
+                if self.stats is not None:
+                    self.stats.iteration(depth, time.perf_counter() - start, self.nodes - start_nodes)
+                # every move removes a piece, so no game lasts longer than the number of pieces
+                if abs(value) == math.inf or depth >= (board.player | board.oppo).bit_count():
+                    break
+                # search the previous best move first next time
+                moves.remove(pv[0])
+                moves.insert(0, pv[0])
+                depth += 1
+        return result
@@ -0,0 +1,35 @@
+import math
+import threading
+from minimax import AlphaBeta
+
+class Ponderer:
+    # searches a position in a background thread while the game loop waits for input. the search
+    # writes to table, so a later search that shares the table starts with its results. the
+    # thread is stopped before anything else touches the table.
+    def __init__(self, table):
+        self.table = table
+        self.engine = None
+        self.thread = None
+
+    def start(self, board):
+        # deepens on board until stop() is called or the game is solved
+        self.stop()
+        self.engine = AlphaBeta(self.table)
+        self.thread = threading.Thread(target=self.engine.iterative_deepening, args=(board, math.inf), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        # iterative_deepening sets its deadline when it starts, so keep moving it into the past
+        # until the search has seen it
+        while self.thread.is_alive():
+            self.engine.deadline = -math.inf
+            self.thread.join(0.01)
+        self.thread = None
+
+    def depth(self):
+        # deepest completed iteration of the current or last search
+        if self.engine is None:
+            return 0
+        return self.engine.completed_depth
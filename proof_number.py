@@ -1,46 +1,52 @@
+import heapq
 import math
+import time
 
 class Node:
-    def __init__(self, label, player, parent, player_pieces, oppo_pieces, parent_move):
+    # a long search keeps many nodes alive, so no per-node __dict__
+    __slots__ = ("label", "children", "parent", "parents", "proof_number", "disproof_number", "player", "board", "parent_move")
+
+    def __init__(self, label, player, parent, board, parent_move):
         self.label = label
         self.children = []
+        # positions are shared between transpositions, so a node can have several parents.
+        # parent and parent_move refer to the parent that first created the node.
         self.parent = parent
+        self.parents = [parent] if parent else []
         self.proof_number = 1
         self.disproof_number = 1
         self.player = player
-        self.player_pieces = player_pieces
-        self.oppo_pieces = oppo_pieces
+        # bitboard with the pieces of the player to move at this node as board.player
+        self.board = board
         self.parent_move = parent_move
 
 class PNSearch:
-    def __init__(self):
-        pass
+    def __init__(self, decomposer=None, endgame=None):
+        # optional cgt.Decomposer that solves positions made of small enough components exactly
+        self.decomposer = decomposer
+        # optional endgame.EndgameTable with the results of small positions
+        self.endgame = endgame
+        # (player, board) -> node, so every position appears once and the tree becomes a dag.
+        # the bitboard is relative to the player to move, so the node type is part of the key.
+        self.table = {}
+
+    def key(self, player, board):
+        # with symmetry enabled, mirror images of a position share one node
+        if board.symmetric_hashes is not None:
+            return player, board.canonical()[0]
+        return player, board
 
-    def look_up(self, node):
-        pass
+    def look_up(self, player, board):
+        return self.table.get(self.key(player, board))
 
     def update(self, node):
-        pass
+        self.table[self.key(node.player, node.board)] = node
 
-    def available_moves(self, player, oppo):
-        moves = []
-        neighbors = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-        for piece in player:
-            for neighbor in neighbors:
-                cell = tuple(sum(t) for t in zip(piece, neighbor))
-                if cell in oppo:
-                    moves.append([piece, cell])
-        return moves
-
-    def make_move(self, player, oppo, move):
-        #print(f"player: {player}")
-        #print(f"oppo: {oppo}")
-        #print(f"move: {move}")
-
-        player.remove(move[0])
-        player.append(move[1])
-        oppo.remove(move[1])
-        return player, oppo
+    def available_moves(self, board):
+        return board.moves()
+
+    def make_move(self, board, move):
+        return board.play(move)
     
     def get_minimum_val(self, children, proof_number):
         best = None
@@ -77,51 +83,85 @@ class PNSearch:
         return best
 
     def select(self, node):
-        if not node.children:
-            return node
-        best = None
-        if node.player == "or":
-            # get child node with smallest proof number
-            best = self.get_minimum_val(node.children, "pn")
-        if node.player == "and":
-            # get child node with smallest disproof number
-            best = self.get_minimum_val(node.children, "dpn")
-        result = self.select(best)
-        return result
+        return self.select_path(node)[-1]
+
+    def select_path(self, node):
+        # nodes from node down to the most proving node below it
+        path = [node]
+        while node.children:
+            if node.player == "or":
+                # get child node with smallest proof number
+                node = self.get_minimum_val(node.children, "pn")
+            else:
+                # get child node with smallest disproof number
+                node = self.get_minimum_val(node.children, "dpn")
+            path.append(node)
+        return path
+
+    def step(self, path):
+        # path runs from the root down to where the last step left off. expands the most proving
+        # node below it and returns the path to continue from: selection from the root would walk
+        # the same nodes down to the first one whose numbers changed, so it resumes above that one.
+        path = path + self.select_path(path[-1])[1:]
+        changed = self.expand(path[-1])
+        for index, node in enumerate(path):
+            if id(node) in changed:
+                return path[:max(index, 1)]
+        return path
 
     def expand(self, node):
         moves = []
         types = ["or", "and"]
         node_type = types[0] if node.player == types[1] else types[1]
-        moves = self.available_moves(node.player_pieces, node.oppo_pieces)
+        moves = self.available_moves(node.board)
         #print(moves)
         # if leaf node, do not backpropagate because this was already done?
         if not moves:
             #self.backpropagate(node.parent)
-            return
+            return set()
+        if node.parent is None or node.board.symmetric_hashes is not None:
+            moves = node.board.unique_moves(moves)
         for move in moves:
-            oppo, player = self.make_move(node.player_pieces.copy(), node.oppo_pieces.copy(), move)
-            new_node = Node(self.move_to_coords(move), node_type, node, player, oppo, move)
-            self.evaluate(new_node)
+            board = self.make_move(node.board, move)
+            new_node = self.look_up(node_type, board)
+            if new_node is not None:
+                if new_node in node.children:
+                    # two moves lead to mirror images of the same position
+                    continue
+                # transposition: share the existing node and its proof numbers
+                new_node.parents.append(node)
+            else:
+                coords = node.board.to_coords(move)
+                new_node = Node(self.move_to_coords(coords), node_type, node, board, coords)
+                self.evaluate(new_node)
+                self.update(new_node)
             node.children.append(new_node)
             #print(new_node.label)
-            #print(f"player_pieces: {new_node.player_pieces}")
-            #print(f"oppo_pieces: {new_node.oppo_pieces}")
         # backpropagate from this node, updating parent nodes to root
-        self.backpropagate(node)
+        return self.backpropagate(node)
 
     def evaluate(self, node):
         if not node.children:
-            moves = self.available_moves(node.player_pieces, node.oppo_pieces)
-            if not moves:
+            if not node.board.has_moves():
                 if node.player == "and":
                     node.proof_number = 0
                     node.disproof_number = math.inf
                 if node.player == "or":
                     node.proof_number = math.inf
                     node.disproof_number = 0
+            else:
+                outcome = self.outcome(node.board)
+                if outcome is None:
+                    return
+                # the player to move wins: an or node is proved, an and node disproved
+                if outcome == (node.player == "or"):
+                    node.proof_number = 0
+                    node.disproof_number = math.inf
+                else:
+                    node.proof_number = math.inf
+                    node.disproof_number = 0
 
-    def backpropagate(self, node):
+    def set_numbers(self, node):
         if node.player == "or":
             min = self.get_minimum_val(node.children, "pn")
             node.proof_number = min.proof_number
@@ -136,7 +176,189 @@ class PNSearch:
             for child in node.children:
                 pn += child.proof_number
             node.proof_number = pn
-        if not node.parent:
+
+    def outcome(self, board):
+        # True if the player to move wins, False if they lose, None if board has to be searched
+        if self.endgame is not None:
+            outcome = self.endgame.look_up(board)
+            if outcome is not None:
+                return outcome
+        if self.decomposer is not None:
+            return self.decomposer.outcome(board)
+        return None
+
+    def backpropagate(self, node):
+        # every move removes exactly one piece, so ancestors always hold more pieces than their
+        # descendants. updating nodes in order of piece count means each node of the dag is
+        # recomputed once, after all of its changed children. a node whose numbers did not change
+        # stops the update there. returns the ids of the nodes whose numbers changed
+        changed = set()
+        queued = {id(node)}
+        heap = [(self.pieces(node), 0, node)]
+        count = 1
+        while heap:
+            pieces, order, current = heapq.heappop(heap)
+            before = (current.proof_number, current.disproof_number)
+            self.set_numbers(current)
+            if (current.proof_number, current.disproof_number) == before:
+                continue
+            changed.add(id(current))
+            if current.proof_number == 0 or current.disproof_number == 0:
+                self.prune(current)
+            for parent in current.parents:
+                if id(parent) not in queued:
+                    queued.add(id(parent))
+                    heapq.heappush(heap, (pieces + 1, count, parent))
+                    count += 1
+        return changed
+
+    def pieces(self, node):
+        return (node.board.player | node.board.oppo).bit_count()
+
+    def prune(self, node):
+        # a solved node is never selected again, so its children are only needed to pick a move.
+        # when the player to move wins, only the child that wins for them is kept; when they lose,
+        # no child is, except at the root, which always keeps the move get_best would play
+        won = node.proof_number == 0 if node.player == "or" else node.disproof_number == 0
+        keep = self.get_best(node) if won or not node.parents else None
+        for child in node.children:
+            if child is not keep:
+                self.unlink(node, child)
+        node.children = [keep] if keep is not None else []
+
+    def unlink(self, parent, child):
+        # removes the edge parent -> child, and drops child from the table once nothing points to it.
+        # solved nodes stay: they are already pruned to at most one child, and a transposition into
+        # one would otherwise have to be solved again
+        edges = [(parent, child)]
+        while edges:
+            parent, child = edges.pop()
+            child.parents.remove(parent)
+            if child.parent is parent:
+                child.parent = child.parents[0] if child.parents else None
+            if child.parents or child.proof_number == 0 or child.disproof_number == 0:
+                continue
+            if self.table.get(self.key(child.player, child.board)) is child:
+                del self.table[self.key(child.player, child.board)]
+            edges.extend((child, grandchild) for grandchild in child.children)
+            child.children = []
+
+class DFPNSearch:
+    # depth-first proof number search. there is no explicit tree: (proof, disproof) numbers live in a
+    # bounded table and are recomputed from the children's entries. numbers are in negamax form,
+    # for the player to move: phi is the proof number and delta the disproof number of the position,
+    # so phi(n) = min delta(child) and delta(n) = sum phi(child).
+    def __init__(self, max_entries=2 ** 20, gc_fraction=0.5, decomposer=None, endgame=None):
+        # board masks -> (phi, delta, work), where work is the number of nodes searched below the entry.
+        # with symmetry enabled on the board, the canonical hash replaces the masks
+        self.table = {}
+        self.max_entries = max_entries
+        self.gc_fraction = gc_fraction
+        self.nodes = 0
+        self.deadline = math.inf
+        self.decomposer = decomposer
+        self.endgame = endgame
+
+    def key(self, board):
+        if board.symmetric_hashes is not None:
+            return board.canonical()[0]
+        return board.player, board.oppo
+
+    def look_up(self, board):
+        return self.table.get(self.key(board), (1, 1, 0))
+
+    def outcome(self, board):
+        # True if the player to move wins, False if they lose, None if board has to be searched
+        if self.endgame is not None:
+            outcome = self.endgame.look_up(board)
+            if outcome is not None:
+                return outcome
+        if self.decomposer is not None:
+            return self.decomposer.outcome(board)
+        return None
+
+    def update(self, board, phi, delta, work):
+        self.table[self.key(board)] = (phi, delta, work)
+        if len(self.table) > self.max_entries:
+            self.collect()
+
+    def collect(self):
+        # hard memory cap: keep the entries that took the most work to compute and drop the rest
+        keep = int(self.max_entries * (1 - self.gc_fraction))
+        entries = sorted(self.table.items(), key=lambda item: item[1][2], reverse=True)
+        self.table = dict(entries[:keep])
+
+    def out_of_time(self):
+        return time.time() * 1000 > self.deadline
+
+    def search(self, board, search_time=math.inf):
+        # returns the proof and disproof numbers of board for the player to move
+        self.deadline = time.time() * 1000 + search_time
+        self.mid(board, math.inf, math.inf)
+        phi, delta, work = self.look_up(board)
+        return phi, delta
+
+    def mid(self, board, phi_threshold, delta_threshold):
+        self.nodes += 1
+        outcome = self.outcome(board)
+        if outcome is not None:
+            if outcome:
+                self.update(board, 0, math.inf, 1)
+            else:
+                self.update(board, math.inf, 0, 1)
+            return
+        moves = board.moves()
+        if not moves:
+            # the player to move has lost
+            self.update(board, math.inf, 0, 1)
             return
-        else:
-            self.backpropagate(node.parent)
+        if board.symmetric_hashes is not None:
+            # mirrored moves would count the same child twice in delta
+            moves = board.unique_moves(moves)
+        children = [board.play(move) for move in moves]
+        work = 1
+        while True:
+            phi = math.inf
+            delta = 0
+            best = None
+            second_delta = math.inf
+            for child in children:
+                child_phi, child_delta, child_work = self.look_up(child)
+                delta += child_phi
+                if child_delta < phi:
+                    second_delta = phi
+                    phi = child_delta
+                    best = child
+                elif child_delta < second_delta:
+                    second_delta = child_delta
+            if phi >= phi_threshold or delta >= delta_threshold or self.out_of_time():
+                break
+            child_phi, child_delta, child_work = self.look_up(best)
+            before = self.nodes
+            self.mid(best, delta_threshold - delta + child_phi, min(phi_threshold, second_delta + 1))
+            work += self.nodes - before
+        self.update(board, phi, delta, work)
+
+    def get_best(self, board):
+        # the move to the child with the smallest disproof number (for the child's player to move),
+        # i.e. a winning move if the position is proved
+        moves = board.moves()
+        if not moves:
+            return None
+        best = None
+        smallest = math.inf
+        for move in moves:
+            child_phi, child_delta, child_work = self.look_up(board.play(move))
+            if child_delta <= smallest:
+                smallest = child_delta
+                best = move
+        phi, delta, work = self.look_up(board)
+        if phi == 0 and smallest != 0:
+            # the proving child was evicted from the table, so solve the children again
+            self.deadline = math.inf
+            for move in moves:
+                child = board.play(move)
+                self.mid(child, math.inf, math.inf)
+                if self.look_up(child)[1] == 0:
+                    return move
+        return best
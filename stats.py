@@ -0,0 +1,97 @@
+import time
+
+class SearchStats:
+    # counters filled in by a search when an instance is set as the engine's stats. engines only
+    # touch it behind an "is not None" check, so searching without one costs nothing extra.
+    def __init__(self):
+        # every node visited, leaves included
+        self.nodes = 0
+        # positions evaluated by the heuristic, terminal positions and positions solved without search
+        self.leaves = 0
+        # ply -> beta cutoffs at that ply
+        self.cutoffs = {}
+        # cutoffs caused by the first move searched, a measure of move ordering
+        self.first_move_cutoffs = 0
+        self.max_depth = 0
+        # (depth, seconds, nodes) of every completed iterative deepening iteration
+        self.iterations = []
+        # cache name -> (hits, probes) during this search
+        self.caches = {}
+        self.root_pieces = 0
+        self.time = 0.0
+        self.start_time = 0.0
+        self.start_counters = {}
+
+    def start(self, board, counters):
+        # counters: cache name -> (hits, probes) so far, see Minimax.cache_counters
+        self.root_pieces = (board.player | board.oppo).bit_count()
+        self.start_counters = counters
+        self.start_time = time.perf_counter()
+
+    def finish(self, nodes, counters):
+        self.time = time.perf_counter() - self.start_time
+        self.nodes = nodes
+        for name, (hits, probes) in counters.items():
+            start_hits, start_probes = self.start_counters.get(name, (0, 0))
+            self.caches[name] = (hits - start_hits, probes - start_probes)
+
+    def ply(self, board):
+        # every move removes one piece, so the distance from the root is the number of pieces taken
+        return self.root_pieces - (board.player | board.oppo).bit_count()
+
+    def leaf(self, ply, count=1):
+        self.leaves += count
+        if ply > self.max_depth:
+            self.max_depth = ply
+
+    def cutoff(self, ply, first=False):
+        self.cutoffs[ply] = self.cutoffs.get(ply, 0) + 1
+        if first:
+            self.first_move_cutoffs += 1
+
+    def first_move_cutoff_rate(self):
+        total = sum(self.cutoffs.values())
+        if not total:
+            return 0.0
+        return self.first_move_cutoffs / total
+
+    def iteration(self, depth, seconds, nodes):
+        self.iterations.append((depth, seconds, nodes))
+
+    def branching_factor(self):
+        # n nodes searched to depth d give an effective branching factor of n ** (1 / d), using the
+        # last completed iteration when there is one
+        if self.iterations:
+            depth, seconds, nodes = self.iterations[-1]
+        else:
+            depth, nodes = self.max_depth, self.nodes
+        if depth <= 0 or nodes <= 0:
+            return 0.0
+        return nodes ** (1 / depth)
+
+    def as_dict(self):
+        return {
+            "nodes": self.nodes,
+            "expanded": self.nodes - self.leaves,
+            "leaves": self.leaves,
+            "cutoffs": dict(sorted(self.cutoffs.items())),
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+            "branching_factor": self.branching_factor(),
+            "max_depth": self.max_depth,
+            "time": self.time,
+            "iterations": [{"depth": depth, "time": seconds, "nodes": nodes} for depth, seconds, nodes in self.iterations],
+            "caches": {name: {"hits": hits, "probes": probes} for name, (hits, probes) in self.caches.items()},
+        }
+
+    def report(self):
+        lines = [f"nodes: {self.nodes} ({self.nodes - self.leaves} expanded, {self.leaves} leaves) in {self.time:.3f}s",
+                 f"max depth: {self.max_depth}, effective branching factor: {self.branching_factor():.2f}"]
+        if self.cutoffs:
+            lines.append("cutoffs by ply: " + ", ".join(f"{ply}: {count}" for ply, count in sorted(self.cutoffs.items())))
+            lines.append(f"first move cutoff rate: {self.first_move_cutoff_rate():.1%}")
+        for depth, seconds, nodes in self.iterations:
+            lines.append(f"depth {depth}: {nodes} nodes in {seconds:.3f}s")
+        for name, (hits, probes) in self.caches.items():
+            rate = hits / probes if probes else 0.0
+            lines.append(f"{name} hit rate: {rate:.1%} ({hits}/{probes})")
+        return "\n".join(lines)
@@ -0,0 +1,159 @@
+import math
+import sqlite3
+import threading
+import time
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# PersistentTable defaults: rows kept on disk, positions written per transaction, and the
+# shallowest searches worth saving (solved positions are always saved)
+MAX_ENTRIES = 2 ** 20
+BATCH = 4096
+MIN_DEPTH = 4
+
+class TranspositionTable:
+    # fixed number of slots indexed by zobrist hash. each slot holds one entry:
+    # (key, value, depth, bound, best move, generation)
+    # values are stored from the point of view of the player to move in the position.
+    def __init__(self, size=2 ** 20):
+        self.size = size
+        self.slots = {}
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+        # entries from earlier searches stay usable but are the first to be replaced
+        self.generation += 1
+
+    def clear(self):
+        self.slots = {}
+
+    def look_up(self, key):
+        self.probes += 1
+        entry = self.slots.get(key % self.size)
+        if entry is None or entry[0] != key:
+            return None
+        self.hits += 1
+        return entry
+
+    def store(self, key, value, depth, bound, move):
+        index = key % self.size
+        entry = self.slots.get(index)
+        if entry is not None and entry[0] != key:
+            # depth-preferred replacement, but never keep a stale entry over a fresh one
+            if entry[5] == self.generation and entry[2] > depth:
+                return
+            self.replacements += 1
+        elif entry is not None and entry[2] > depth and entry[5] == self.generation:
+            # same position already searched deeper in this search: only refresh the move
+            if move is not None:
+                self.slots[index] = entry[:4] + (move, self.generation)
+            return
+        self.stores += 1
+        self.slots[index] = (key, value, depth, bound, move, self.generation)
+
+    def flush(self):
+        # nothing to write for a table that only lives in memory, see PersistentTable
+        pass
+
+    def hit_rate(self):
+        if not self.probes:
+            return 0.0
+        return self.hits / self.probes
+
+    def __len__(self):
+        return len(self.slots)
+
+class PersistentTable(TranspositionTable):
+    # transposition table backed by a sqlite file, so searches in later sessions and in other
+    # processes start from what earlier ones found. the file is opened and the most recently
+    # written rows are read into the table on first use. stores of solved positions and of
+    # searches at least min_depth deep are queued and written in one transaction every batch
+    # stores and on flush. when a row is written for a key that is already on disk, the deeper
+    # search wins. past max_entries rows the least recently written are deleted. sqlite's
+    # locking and write-ahead log make it safe for several processes to share one file, and the
+    # connection may be used from any thread (a ponder thread opens it, the game loop flushes it)
+    # one at a time.
+    def __init__(self, path, size=2 ** 20, max_entries=MAX_ENTRIES, min_depth=MIN_DEPTH, batch=BATCH):
+        super().__init__(size)
+        self.path = path
+        self.max_entries = max_entries
+        self.min_depth = min_depth
+        self.batch = batch
+        self.connection = None
+        self.lock = threading.Lock()
+        # key -> (value, depth, bound, move) waiting to be written
+        self.pending = {}
+
+    def open(self):
+        with self.lock:
+            if self.connection is None:
+                self.load()
+
+    def load(self):
+        self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS positions (key INTEGER PRIMARY KEY, value REAL, depth INTEGER, "
+                                "bound INTEGER, origin INTEGER, destination INTEGER, written REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS positions_written ON positions (written)")
+        rows = self.connection.execute("SELECT key, value, depth, bound, origin, destination FROM positions "
+                                       "ORDER BY written DESC LIMIT ?", (self.size,))
+        for key, value, depth, bound, origin, destination in rows:
+            # sqlite integers are signed, zobrist keys are not
+            key += 1 << 63
+            move = None if origin is None else (origin, destination)
+            entry = self.slots.get(key % self.size)
+            if entry is None or entry[2] < depth:
+                self.slots[key % self.size] = (key, value, depth, bound, move, self.generation)
+
+    def look_up(self, key):
+        if self.connection is None:
+            self.open()
+        return super().look_up(key)
+
+    def store(self, key, value, depth, bound, move):
+        if self.connection is None:
+            self.open()
+        super().store(key, value, depth, bound, move)
+        if depth < self.min_depth and abs(value) != math.inf:
+            return
+        queued = self.pending.get(key)
+        if queued is None or queued[1] <= depth:
+            self.pending[key] = (value, depth, bound, move)
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.write()
+
+    def write(self):
+        if not self.pending:
+            return
+        now = time.time()
+        rows = [(key - (1 << 63), value, depth, bound, None if move is None else move[0], None if move is None else move[1], now)
+                for key, (value, depth, bound, move) in self.pending.items()]
+        self.pending = {}
+        # one transaction per batch: other processes see all of it or none of it
+        with self.connection:
+            self.connection.executemany("INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                                        "value = excluded.value, depth = excluded.depth, bound = excluded.bound, "
+                                        "origin = excluded.origin, destination = excluded.destination, written = excluded.written "
+                                        "WHERE excluded.depth >= positions.depth", rows)
+            count = self.connection.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute("DELETE FROM positions WHERE key IN (SELECT key FROM positions ORDER BY written LIMIT ?)",
+                                        (count - self.max_entries,))
+
+    def close(self):
+        with self.lock:
+            if self.connection is None:
+                return
+            self.write()
+            self.connection.close()
+            self.connection = None